@@ -0,0 +1,402 @@
+# bot_runner.py - Génération et lancement des bots utilisateurs
+import os
+import subprocess
+from typing import Dict
+
+from database import User
+from tenant_config import send_config
+
+def create_user_bot(user: User, worker_id: str, config: Dict):
+    """Crée et lance un bot pour l'utilisateur (affectation déjà prise par worker_id)"""
+    try:
+        # Créer le dossier pour les bots utilisateurs
+        os.makedirs("user_bots", exist_ok=True)
+        
+        # Créer le script du bot personnalisé (la config est envoyée sur stdin, jamais écrite sur disque)
+        bot_script_path = f"user_bots/bot_{user.id}.py"
+        create_user_bot_script(bot_script_path, user.id)
+        
+        # Lancer le bot dans sa propre session : son PID est aussi son groupe de processus
+        process = subprocess.Popen([
+            "python", bot_script_path
+        ], cwd=os.getcwd(), start_new_session=True, env={**os.environ, "BOT_WORKER_ID": worker_id},
+           stdin=subprocess.PIPE, text=True)
+        send_config(process.stdin, config)
+        
+        print(f"Bot lancé pour {user.email} - PID: {process.pid}")
+        return process
+        
+    except Exception as e:
+        print(f"Erreur création bot pour {user.email}: {e}")
+        return None
+
+def create_user_bot_script(script_path: str, user_id: int):
+    """Crée le script du bot personnalisé pour l'utilisateur"""
+    project_dir = os.getcwd()
+    
+    bot_script_content = f'''#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bot HyperLiquid personnalisé - Utilisateur {user_id}
+Généré automatiquement par la plateforme SaaS
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import requests
+from hyperliquid.info import Info
+from hyperliquid.utils import constants
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+
+# Modules partagés de la plateforme
+sys.path.insert(0, r"{project_dir}")
+from log_store import setup_bot_logging
+from tenant_config import ConfigStream
+from outbox import enqueue, enqueue_many, deliver_pending, RETENTION as OUTBOX_RETENTION
+from fill_store import FillStore
+from rate_budget import RateBudget, BudgetUnavailable, REQUEST_WEIGHTS, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from sharding import still_assigned, FENCE_INTERVAL
+
+# Setup logging (file non bloquante vers le stockage centralisé logs/bots)
+setup_bot_logging({user_id})
+logger = logging.getLogger(__name__)
+
+USER_ID = {user_id}
+WORKER_ID = os.environ.get("BOT_WORKER_ID")     # Worker qui a lancé le bot (None = lancement manuel)
+HOSTNAME = socket.gethostname()
+RATE_BUDGET = RateBudget()
+
+# Configuration envoyée par le worker sur stdin (mise à jour à chaud par son registre)
+CONFIG_STREAM = ConfigStream(USER_ID)
+CONFIG = CONFIG_STREAM.config
+
+class HyperLiquidBot:
+    def __init__(self):
+        self.info = Info(constants.MAINNET_API_URL, skip_ws=True)
+        self.fill_store = FillStore(CONFIG['WALLET_ADDRESS'])
+        self.last_known_trades = set()
+        self.daily_stats = self.init_daily_stats()
+        self.bot_start_time = datetime.now()
+        self.last_report_date = None
+        self.restart_requested = False
+        CONFIG_STREAM.on_change(self.on_config_change)
+        
+    def on_config_change(self, user_id: int, config: Dict, changed: Dict):
+        """Applique une modification de configuration sans redémarrage"""
+        if 'WALLET_ADDRESS' in changed:
+            self.fill_store = FillStore(config['WALLET_ADDRESS'])
+            self.last_known_trades = set()
+        if 'TELEGRAM_TOKEN' in changed:
+            # Le client Telegram est lié au token : le worker relance le bot
+            self.restart_requested = True
+        
+    def init_daily_stats(self) -> Dict:
+        return {{
+            'trades_count': 0,
+            'winning_trades': 0,
+            'losing_trades': 0,
+            'total_pnl': 0.0,
+            'total_volume': 0.0,
+            'start_balance': 0.0,
+            'date': datetime.now().strftime('%Y-%m-%d')
+        }}
+
+    def get_user_state(self, priority: int = PRIORITY_BACKGROUND) -> Dict:
+        """Récupère l'état du compte utilisateur"""
+        try:
+            user_state = RATE_BUDGET.call(
+                lambda: self.info.user_state(CONFIG['WALLET_ADDRESS']),
+                weight=REQUEST_WEIGHTS['user_state'],
+                priority=priority
+            )
+            return user_state
+        except BudgetUnavailable as e:
+            logger.warning(f"État utilisateur non récupéré: {{e}}")
+            return {{}}
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération de l'état utilisateur: {{e}}")
+            return {{}}
+
+    def get_user_fills(self) -> Optional[List[Dict]]:
+        """Récupère l'historique des trades (None si le poll n'a pas eu lieu)"""
+        try:
+            fills = RATE_BUDGET.call(
+                lambda: self.info.user_fills(CONFIG['WALLET_ADDRESS']),
+                weight=REQUEST_WEIGHTS['user_fills']
+            )
+            return fills if fills else []
+        except BudgetUnavailable as e:
+            logger.warning(f"Poll des trades reporté: {{e}}")
+            return None
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération des trades: {{e}}")
+            return None
+
+    def format_trade_notification(self, trade: Dict) -> str:
+        """Formate une notification de trade"""
+        try:
+            side = "🟢 ACHAT" if trade.get('side') == 'B' else "🔴 VENTE"
+            coin = trade.get('coin', 'Unknown')
+            size = float(trade.get('sz', 0))
+            price = float(trade.get('px', 0))
+            total_value = size * price
+            fee = float(trade.get('fee', 0))
+            timestamp = datetime.fromtimestamp(int(trade.get('time', 0)) / 1000)
+            
+            pnl_text = ""
+            if 'closedPnl' in trade:
+                pnl = float(trade['closedPnl'])
+                pnl_emoji = "💰" if pnl > 0 else "💸" if pnl < 0 else "⚖️"
+                pnl_text = f"\\n{{pnl_emoji}} P&L: {{pnl:+.2f}} USDC"
+            
+            message = f"""
+🎯 <b>NOUVEAU TRADE DÉTECTÉ</b>
+
+{{side}} <b>{{coin}}</b>
+📊 Quantité: {{size:.4f}}
+💵 Prix: ${{price:.4f}}
+💰 Valeur: ${{total_value:.2f}}
+⚡ Frais: ${{fee:.4f}}
+🕐 Heure: {{timestamp.strftime('%H:%M:%S')}}{{pnl_text}}
+
+📈 Consultez vos stats avec /status
+            """.strip()
+            
+            return message
+        except Exception as e:
+            logger.error(f"Erreur formatage trade: {{e}}")
+            return f"🚨 Trade détecté (erreur de formatage): {{str(trade)[:100]}}..."
+
+    def check_new_trades(self):
+        """Vérifie s'il y a de nouveaux trades"""
+        try:
+            current_trades = self.get_user_fills()
+            if current_trades is None:
+                return  # Poll reporté : garder les trades connus
+            
+            # Historique local pour les statistiques
+            self.fill_store.append(current_trades)
+            
+            current_trade_ids = set()
+            notifications = []
+            # Au-delà de la rétention de l'outbox, la clé d'idempotence a pu être purgée
+            cutoff_ms = int((time.time() - OUTBOX_RETENTION.total_seconds()) * 1000)
+            for trade in current_trades[:10]:
+                trade_id = f"{{trade.get('oid', '')}}-{{trade.get('time', '')}}"
+                current_trade_ids.add(trade_id)
+                
+                if trade_id not in self.last_known_trades and int(trade.get('time', 0)) >= cutoff_ms:
+                    logger.info(f"Nouveau trade détecté: {{trade_id}}")
+                    notifications.append({{
+                        'user_id': USER_ID,
+                        'idempotency_key': f"fill:{{USER_ID}}:{{trade_id}}",
+                        'message': self.format_trade_notification(trade),
+                    }})
+            
+            # Écriture durable dans l'outbox avant de considérer les trades comme connus
+            enqueue_many(notifications)
+            self.last_known_trades = current_trade_ids
+            
+        except Exception as e:
+            logger.error(f"Erreur vérification trades: {{e}}")
+
+    def format_daily_report(self, stats: Dict, day: str) -> str:
+        """Formate le rapport quotidien"""
+        win_rate = f"{{stats['win_rate'] * 100:.0f}}%" if stats['win_rate'] is not None else "-"
+        pnl_emoji = "💰" if stats['net_pnl'] > 0 else "💸" if stats['net_pnl'] < 0 else "⚖️"
+        coins = "\\n".join(
+            f"• {{coin}}: ${{volume:.2f}}"
+            for coin, volume in sorted(stats['volume_by_coin'].items(), key=lambda item: -item[1])[:5]
+        )
+        return f"""
+📊 <b>RAPPORT QUOTIDIEN - {{day}}</b>
+
+🎯 Trades: {{stats['trades_count']}} ({{stats['winning_trades']}} gagnants / {{stats['losing_trades']}} perdants)
+🏆 Taux de réussite: {{win_rate}}
+{{pnl_emoji}} P&L net: {{stats['net_pnl']:+.2f}} USDC
+⚡ Frais: ${{stats['total_fees']:.2f}}
+💵 Volume: ${{stats['total_volume']:.2f}}
+{{coins}}
+        """.strip()
+
+    def send_daily_report(self):
+        """Met le rapport du jour dans l'outbox une fois l'heure configurée passée"""
+        now = datetime.now()
+        today = now.strftime('%Y-%m-%d')
+        if self.last_report_date == today or now.strftime('%H:%M') < CONFIG['DAILY_REPORT_TIME']:
+            return
+        try:
+            start_of_day = datetime.combine(now.date(), datetime.min.time())
+            stats = self.fill_store.summary(int(start_of_day.timestamp() * 1000), int(now.timestamp() * 1000))
+            # Clé par jour : pas de doublon si le bot redémarre après l'heure du rapport
+            enqueue(USER_ID, f"daily:{{USER_ID}}:{{today}}", self.format_daily_report(stats, today))
+            self.last_report_date = today
+        except Exception as e:
+            logger.error(f"Erreur rapport quotidien: {{e}}")
+
+    def send_telegram_message(self, message: str, parse_mode: str = 'HTML') -> bool:
+        """Envoie un message via Telegram"""
+        try:
+            url = f"https://api.telegram.org/bot{{CONFIG['TELEGRAM_TOKEN']}}/sendMessage"
+            payload = {{
+                'chat_id': CONFIG['CHAT_ID'],
+                'text': message,
+                'parse_mode': parse_mode
+            }}
+            
+            response = requests.post(url, json=payload, timeout=10)
+            if response.status_code != 200:
+                logger.error(f"Erreur Telegram: {{response.text}}")
+                return False
+            return True
+                
+        except Exception as e:
+            logger.error(f"Erreur envoi message: {{e}}")
+            return False
+
+    def deliver_notifications(self):
+        """Livre les notifications en attente dans l'outbox"""
+        try:
+            deliver_pending(
+                lambda notification: self.send_telegram_message(notification.message, notification.parse_mode),
+                user_id=USER_ID
+            )
+        except Exception as e:
+            logger.error(f"Erreur livraison outbox: {{e}}")
+
+class TelegramBotHandlers:
+    def __init__(self, hyperliquid_bot: HyperLiquidBot):
+        self.hl_bot = hyperliquid_bot
+
+    async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Commande /start"""
+        welcome_msg = f"""
+🤖 <b>Votre Bot HyperLiquid Personnel</b>
+
+Bienvenue ! Je surveille vos trades en temps réel.
+
+🔄 Vérification: toutes les {{CONFIG['CHECK_INTERVAL']}}s
+📊 Rapport quotidien: {{CONFIG['DAILY_REPORT_TIME']}}
+🚨 Notifications instantanées
+
+Tapez /status pour voir votre portfolio !
+        """.strip()
+        
+        await update.message.reply_text(welcome_msg, parse_mode='HTML')
+
+    async def status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Commande /status (prioritaire sur les polls de fond)"""
+        user_state = await asyncio.to_thread(self.hl_bot.get_user_state, PRIORITY_INTERACTIVE)
+        if not user_state:
+            await update.message.reply_text("⚠️ Portfolio indisponible pour le moment, réessayez dans quelques instants.")
+            return
+        
+        summary = user_state.get('marginSummary', {{}})
+        lines = [
+            "📊 <b>VOTRE PORTFOLIO</b>",
+            "",
+            f"💰 Valeur du compte: ${{float(summary.get('accountValue', 0)):.2f}}",
+            f"📦 Marge utilisée: ${{float(summary.get('totalMarginUsed', 0)):.2f}}",
+        ]
+        for asset_position in user_state.get('assetPositions', []):
+            position = asset_position.get('position', {{}})
+            size = float(position.get('szi', 0))
+            if size == 0:
+                continue
+            pnl = float(position.get('unrealizedPnl', 0))
+            direction = "🟢 LONG" if size > 0 else "🔴 SHORT"
+            lines.append(f"{{direction}} <b>{{position.get('coin')}}</b> {{abs(size):.4f}} - P&L: {{pnl:+.2f}} USDC")
+        
+        await update.message.reply_text("\\n".join(lines), parse_mode='HTML')
+
+async def run_scheduled_jobs(hl_bot):
+    """Exécute les tâches programmées"""
+    last_check = 0
+    last_fence = 0
+    
+    while not hl_bot.restart_requested:
+        try:
+            current_time = time.time()
+            
+            # Un seul bot par utilisateur : s'arrêter si un autre worker a repris l'affectation
+            if WORKER_ID and current_time - last_fence >= FENCE_INTERVAL:
+                if not await asyncio.to_thread(still_assigned, USER_ID, WORKER_ID, HOSTNAME, os.getpid()):
+                    logger.warning("Utilisateur repris par un autre worker, arrêt du bot")
+                    return
+                last_fence = current_time
+            
+            if current_time - last_check >= CONFIG['CHECK_INTERVAL']:
+                # Appels bloquants (budget, HyperLiquid, outbox) hors de la boucle asyncio
+                await asyncio.to_thread(hl_bot.check_new_trades)
+                last_check = current_time
+            
+            await asyncio.to_thread(hl_bot.send_daily_report)
+            await asyncio.to_thread(hl_bot.deliver_notifications)
+            
+            await asyncio.sleep(1)
+            
+        except Exception as e:
+            logger.error(f"Erreur dans les tâches: {{e}}")
+            await asyncio.sleep(5)
+    
+    logger.info("Token Telegram modifié, redémarrage du bot")
+
+async def main():
+    """Fonction principale"""
+    hl_bot = HyperLiquidBot()
+    handlers = TelegramBotHandlers(hl_bot)
+    
+    app = Application.builder().token(CONFIG['TELEGRAM_TOKEN']).build()
+    app.add_handler(CommandHandler("start", handlers.start))
+    app.add_handler(CommandHandler("status", handlers.status))
+    
+    startup_msg = f"""
+🚀 <b>VOTRE BOT EST ACTIF !</b>
+
+✅ Surveillance de votre wallet
+📱 Notifications configurées
+🎯 Prêt à tracker vos trades !
+
+Tapez /start pour commencer.
+    """.strip()
+    
+    hl_bot.send_telegram_message(startup_msg)
+    logger.info("Bot utilisateur {user_id} démarré")
+    
+    await app.initialize()
+    await app.start()
+    await app.updater.start_polling()
+    
+    scheduled_task = asyncio.create_task(run_scheduled_jobs(hl_bot))
+    loop = asyncio.get_running_loop()
+    # SIGTERM du worker : arrêt propre pour fermer (sceller) le segment de logs
+    loop.add_signal_handler(signal.SIGTERM, scheduled_task.cancel)
+    # Fin de stdin : le worker est mort, le bot s'arrête aussi
+    CONFIG_STREAM.start(on_close=lambda: loop.call_soon_threadsafe(scheduled_task.cancel))
+    
+    try:
+        logger.info("Bot en cours d'exécution...")
+        await scheduled_task
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logger.info("Arrêt du bot")
+    finally:
+        scheduled_task.cancel()
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
+'''
+    
+    with open(script_path, 'w', encoding='utf-8') as f:
+        f.write(bot_script_content)
@@ -0,0 +1,89 @@
+# dashboard_stats.py - Compteurs du dashboard admin maintenus incrémentalement
+"""
+Les totaux du dashboard sont tenus dans dashboard_counters et mis à jour dans
+la même transaction que l'inscription / activation / désactivation / Signum.
+L'affichage lit quelques lignes au lieu de charger toute la table users.
+"""
+
+from datetime import date, timedelta
+from typing import Dict
+
+from sqlalchemy import func, case, or_
+from sqlalchemy.orm import Session
+
+from database import User, BotAssignment, DashboardCounter, DashboardDaily, upsert
+
+COUNTERS = ("total_users", "active_users", "signum_connected")
+SERIES_DAYS = 14
+
+
+def increment(db: Session, name: str, delta: int = 1):
+    """Incrémente un compteur (sans commit)"""
+    stmt = upsert(DashboardCounter).values(name=name, value=delta)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'value': DashboardCounter.value + stmt.excluded.value}
+    ))
+
+
+def record_daily(db: Session, field: str, delta: int = 1):
+    """Ajoute un événement à la série du jour (signups / activations, sans commit)"""
+    stmt = upsert(DashboardDaily).values(**{'day': date.today(), 'signups': 0, 'activations': 0, field: delta})
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=['day'],
+        set_={field: getattr(DashboardDaily, field) + getattr(stmt.excluded, field)}
+    ))
+
+
+def set_user_flag(db: Session, user_id: int, column, value: bool) -> bool:
+    """Bascule un drapeau utilisateur (sans commit) ; True seulement si cette requête l'a changé"""
+    # UPDATE conditionnel : deux requêtes concurrentes ne comptent pas deux fois
+    current = column == (not value)
+    if value:
+        current = or_(current, column == None)
+    updated = db.query(User).filter(User.id == user_id, current).update(
+        {column: value}, synchronize_session=False
+    )
+    return updated == 1
+
+
+def rebuild_counters(db: Session):
+    """Recalcule les compteurs par agrégats SQL (démarrage / correction de dérive)"""
+    total, active, signum = db.query(
+        func.count(User.id),
+        func.coalesce(func.sum(case((User.is_active == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((User.signum_connected == True, 1), else_=0)), 0),
+    ).one()
+    for name, value in zip(COUNTERS, (total, active, signum)):
+        stmt = upsert(DashboardCounter).values(name=name, value=value)
+        db.execute(stmt.on_conflict_do_update(index_elements=['name'], set_={'value': stmt.excluded.value}))
+    db.commit()
+
+
+def get_stats(db: Session, days: int = SERIES_DAYS) -> Dict:
+    """Chiffres du dashboard + série quotidienne des inscriptions / activations"""
+    counters = {name: 0 for name in COUNTERS}
+    counters.update({row.name: row.value for row in db.query(DashboardCounter).all()})
+
+    bots_running = db.query(func.count(BotAssignment.user_id)).filter(
+        BotAssignment.bot_pid != None
+    ).scalar()
+
+    start = date.today() - timedelta(days=days - 1)
+    rows = {row.day: row for row in db.query(DashboardDaily).filter(DashboardDaily.day >= start).all()}
+    series = []
+    for i in range(days):
+        day = start + timedelta(days=i)
+        row = rows.get(day)
+        series.append({
+            'day': day.isoformat(),
+            'signups': row.signups if row else 0,
+            'activations': row.activations if row else 0,
+        })
+
+    return {
+        **counters,
+        'pending_users': counters['total_users'] - counters['active_users'],
+        'bots_running': bots_running,
+        'series': series,
+    }
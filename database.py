@@ -0,0 +1,135 @@
+# database.py - Base de données partagée (API, bots, workers)
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Date, Boolean, Text, Float, Index
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime
+import os
+
+# Configuration
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./hyperliquid_saas.db")
+
+# Base de données
+if DATABASE_URL.startswith("sqlite"):
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 30})
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL : les bots écrivent pendant que l'API lit
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+else:
+    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base = declarative_base()
+
+# Tables jamais recréées au démarrage de l'API (notifications en attente, journaux, historique)
+DURABLE_TABLES = {"notification_outbox", "tenant_config_changes", "dashboard_daily", "risk_alert_state"}
+
+def upsert(model):
+    """INSERT supportant ON CONFLICT (SQLite / PostgreSQL)"""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, unique=True, index=True)
+    name = Column(String)
+    wallet_address = Column(String)                   # Wallet principal
+    api_wallet_address = Column(String)               # Adresse API wallet
+    api_public_key = Column(String)                   # Clé publique API
+    api_private_key = Column(String)                  # Clé privée API (UNE SEULE FOIS)
+    telegram_token = Column(String)
+    telegram_chat_id = Column(String)
+    is_active = Column(Boolean, default=False)
+    signum_connected = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    bot_process_id = Column(String, nullable=True)
+    check_interval = Column(Integer, default=30)                # Secondes entre deux polls
+    daily_report_time = Column(String, default='23:59')
+
+class TenantConfigChange(Base):
+    __tablename__ = "tenant_config_changes"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)   # Curseur des registres
+    user_id = Column(Integer, nullable=False, index=True)
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    idempotency_key = Column(String, unique=True, nullable=False)   # Ex: fill:{user_id}:{oid}-{time}
+    message = Column(Text, nullable=False)
+    parse_mode = Column(String, default='HTML')
+    status = Column(String, default='pending')                      # pending / sent / failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_pending", "status", "user_id", "next_attempt_at"),
+    )
+
+class Worker(Base):
+    __tablename__ = "workers"
+
+    worker_id = Column(String, primary_key=True)
+    hostname = Column(String)
+    pid = Column(Integer)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class BotAssignment(Base):
+    __tablename__ = "bot_assignments"
+
+    user_id = Column(Integer, primary_key=True)
+    worker_id = Column(String, nullable=True, index=True)   # None = en attente d'un worker
+    bot_pid = Column(Integer, nullable=True, index=True)     # PID (= groupe de processus) sur la machine du worker
+    hostname = Column(String, nullable=True)                 # Machine du bot
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class RateBudgetBucket(Base):
+    __tablename__ = "rate_budget_buckets"
+
+    second = Column(Integer, primary_key=True)      # Timestamp Unix (s) du bucket
+    weight = Column(Integer, nullable=False, default=0)
+
+class RateBudgetCircuit(Base):
+    __tablename__ = "rate_budget_circuit"
+
+    id = Column(Integer, primary_key=True)          # Ligne unique (id=1)
+    failures = Column(Integer, default=0)
+    open_until = Column(Float, default=0.0)         # Timestamp Unix de fin de coupure
+    last_error = Column(String, nullable=True)
+
+class RiskAlertState(Base):
+    __tablename__ = "risk_alert_state"
+
+    user_id = Column(Integer, primary_key=True)
+    kind = Column(String, primary_key=True)         # liquidation / margin
+    coin = Column(String, primary_key=True, default='')
+    episode = Column(Integer, nullable=False, default=0)   # Incrémenté à chaque nouvelle alerte
+    alerted = Column(Boolean, nullable=False, default=False)
+
+class DashboardCounter(Base):
+    __tablename__ = "dashboard_counters"
+
+    name = Column(String, primary_key=True)         # total_users / active_users / signum_connected
+    value = Column(Integer, nullable=False, default=0)
+
+class DashboardDaily(Base):
+    __tablename__ = "dashboard_daily"
+
+    day = Column(Date, primary_key=True)
+    signups = Column(Integer, nullable=False, default=0)
+    activations = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,188 @@
+# fill_store.py - Historique local des fills par wallet
+"""
+Stockage append-only des fills HyperLiquid : un fichier binaire de
+records fixes par wallet (lisible en np.memmap) + la liste des coins.
+Les statistiques sont calculées de façon vectorisée sur une plage de temps.
+"""
+
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Configuration
+FILL_DIR = os.getenv("FILL_STORE_DIR", "data/fills")
+WALLET_PATTERN = re.compile(r"^0x[0-9a-fA-F]{40}$")
+
+FILL_DTYPE = np.dtype([
+    ('time', '<i8'),         # Timestamp ms
+    ('tid', '<i8'),          # Identifiant du fill
+    ('oid', '<i8'),          # Identifiant de l'ordre
+    ('coin', '<i4'),         # Index dans la liste des coins
+    ('side', 'i1'),          # +1 achat, -1 vente
+    ('px', '<f8'),
+    ('sz', '<f8'),
+    ('fee', '<f8'),
+    ('closed_pnl', '<f8'),
+])
+
+
+def is_valid_wallet(wallet_address: str) -> bool:
+    """Adresse HyperLiquid : 0x + 40 caractères hexadécimaux"""
+    return bool(wallet_address) and WALLET_PATTERN.match(wallet_address) is not None
+
+
+class FillStore:
+    """Fills d'un wallet, triés par temps, en append-only"""
+
+    def __init__(self, wallet_address: str, data_dir: str = FILL_DIR):
+        # L'adresse sert de nom de fichier : refuser tout ce qui n'est pas une adresse
+        if not is_valid_wallet(wallet_address):
+            raise ValueError(f"Adresse de wallet invalide: {wallet_address!r}")
+        os.makedirs(data_dir, exist_ok=True)
+        wallet = wallet_address.lower()
+        self.path = os.path.join(data_dir, f"{wallet}.fills")
+        self.coins_path = os.path.join(data_dir, f"{wallet}.coins.json")
+        self.coins = self._load_coins()
+        self.coin_index = {coin: i for i, coin in enumerate(self.coins)}
+        self._array = None
+        self._array_size = -1
+        self._repaired = False
+
+    def _load_coins(self) -> List[str]:
+        try:
+            with open(self.coins_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _save_coins(self):
+        tmp_path = self.coins_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.coins, f)
+        os.replace(tmp_path, self.coins_path)
+
+    def _repair(self):
+        """Tronque un éventuel record partiel (crash pendant une écriture, écrivain seulement)"""
+        if os.path.exists(self.path):
+            size = os.path.getsize(self.path)
+            if size % FILL_DTYPE.itemsize:
+                with open(self.path, 'r+b') as f:
+                    f.truncate(size - size % FILL_DTYPE.itemsize)
+
+    def fills(self) -> np.ndarray:
+        """Vue memmap en lecture seule de tous les fills"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        count = size // FILL_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=FILL_DTYPE)
+        if count != self._array_size:
+            # Le bot peut avoir ajouté des coins : liste relue avec les nouveaux records
+            self.coins = self._load_coins()
+            self.coin_index = {coin: i for i, coin in enumerate(self.coins)}
+            self._array = np.memmap(self.path, dtype=FILL_DTYPE, mode='r', shape=(count,))
+            self._array_size = count
+        return self._array
+
+    def _coin_id(self, coin: str) -> int:
+        if coin not in self.coin_index:
+            self.coin_index[coin] = len(self.coins)
+            self.coins.append(coin)
+            self._save_coins()
+        return self.coin_index[coin]
+
+    def append(self, fills: List[Dict]) -> int:
+        """Ajoute les fills (format user_fills) plus récents que le dernier stocké"""
+        if not self._repaired:
+            self._repair()
+            self._repaired = True
+        existing = self.fills()
+        last_time = int(existing['time'][-1]) if len(existing) else -1
+        # Fills déjà stockés avec le même timestamp que le dernier
+        seen_tids = set(existing['tid'][existing['time'] == last_time].tolist()) if len(existing) else set()
+
+        records = []
+        for fill in fills:
+            fill_time = int(fill.get('time', 0))
+            tid = int(fill.get('tid', 0))
+            if fill_time < last_time or (fill_time == last_time and tid in seen_tids):
+                continue
+            records.append((
+                fill_time,
+                tid,
+                int(fill.get('oid', 0)),
+                self._coin_id(fill.get('coin', 'Unknown')),
+                1 if fill.get('side') == 'B' else -1,
+                float(fill.get('px', 0)),
+                float(fill.get('sz', 0)),
+                float(fill.get('fee', 0)),
+                float(fill.get('closedPnl', 0)),
+            ))
+
+        if not records:
+            return 0
+
+        new = np.array(records, dtype=FILL_DTYPE)
+        new = new[np.argsort(new, order=('time', 'tid'))]
+        new = new[np.unique(new[['time', 'tid']], return_index=True)[1]]
+
+        with open(self.path, 'ab') as f:
+            f.write(new.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        return len(new)
+
+    def range(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> np.ndarray:
+        """Fills dont le timestamp est dans [start_ms, end_ms]"""
+        fills = self.fills()
+        times = fills['time']
+        lo = 0 if start_ms is None else np.searchsorted(times, start_ms, side='left')
+        hi = len(fills) if end_ms is None else np.searchsorted(times, end_ms, side='right')
+        return fills[lo:hi]
+
+    def pnl_curve(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                  max_points: Optional[int] = None):
+        """P&L net cumulé (P&L réalisé - frais) : (timestamps, valeurs)"""
+        fills = self.range(start_ms, end_ms)
+        times = np.asarray(fills['time'])
+        curve = np.cumsum(fills['closed_pnl'] - fills['fee'])
+        if max_points and len(curve) > max_points:
+            keep = np.linspace(0, len(curve) - 1, max_points).astype(np.int64)
+            times, curve = times[keep], curve[keep]
+        return times, curve
+
+    def win_rate(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Optional[float]:
+        """Part des fills de clôture gagnants (None si aucun)"""
+        pnl = self.range(start_ms, end_ms)['closed_pnl']
+        closing = np.count_nonzero(pnl)
+        if not closing:
+            return None
+        return float(np.count_nonzero(pnl > 0) / closing)
+
+    def volume_by_coin(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Dict[str, float]:
+        """Volume notionnel (px * sz) par coin"""
+        fills = self.range(start_ms, end_ms)
+        volumes = np.bincount(fills['coin'], weights=fills['px'] * fills['sz'], minlength=len(self.coins))
+        return {self.coins[i]: float(volumes[i]) for i in np.flatnonzero(volumes)}
+
+    def fees(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> float:
+        return float(self.range(start_ms, end_ms)['fee'].sum())
+
+    def summary(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Dict:
+        """Statistiques principales sur une plage de temps"""
+        fills = self.range(start_ms, end_ms)
+        pnl = fills['closed_pnl']
+        closing = np.count_nonzero(pnl)
+        return {
+            'trades_count': int(len(fills)),
+            'winning_trades': int(np.count_nonzero(pnl > 0)),
+            'losing_trades': int(np.count_nonzero(pnl < 0)),
+            'win_rate': float(np.count_nonzero(pnl > 0) / closing) if closing else None,
+            'total_pnl': float(pnl.sum()),
+            'total_fees': float(fills['fee'].sum()),
+            'net_pnl': float(pnl.sum() - fills['fee'].sum()),
+            'total_volume': float((fills['px'] * fills['sz']).sum()),
+            'volume_by_coin': self.volume_by_coin(start_ms, end_ms),
+        }
@@ -0,0 +1,330 @@
+# log_store.py - Stockage centralisé des logs des bots
+"""
+Logs des bots clients : écriture non bloquante via une file (QueueHandler),
+segments JSON Lines tournants compressés en gzip, et petit index SQLite
+(utilisateur, niveau max, plage de temps) pour filtrer sans tout relire.
+"""
+
+import atexit
+import gzip
+import heapq
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+# Configuration
+LOG_DIR = os.getenv("BOT_LOG_DIR", "logs/bots")
+MAX_SEGMENT_BYTES = 5 * 1024 * 1024      # Rotation à 5 Mo
+MAX_SEGMENTS_PER_USER = 20               # Segments compressés conservés par utilisateur
+INDEX_FLUSH_INTERVAL = 5                 # Secondes entre deux mises à jour de l'index
+ORPHAN_MAX_AGE = 3600                    # Segment d'une autre machine inactif depuis 1h = orphelin
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def _open_index(log_dir: str) -> sqlite3.Connection:
+    """Ouvre (et crée si besoin) l'index des segments"""
+    os.makedirs(log_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(log_dir, "index.db"), timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS segments (
+            path TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            first_ts REAL NOT NULL,
+            last_ts REAL NOT NULL,
+            max_level INTEGER NOT NULL,
+            lines INTEGER NOT NULL,
+            sealed INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_segments_user_time ON segments (user_id, first_ts, last_ts)")
+    conn.commit()
+    return conn
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _segment_stats(path: str):
+    """(first_ts, last_ts, max_level, lines) d'un segment brut"""
+    first_ts = last_ts = None
+    max_level = 0
+    lines = 0
+    for line in _read_segment(path):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if first_ts is None:
+            first_ts = entry['ts']
+        last_ts = entry['ts']
+        level = logging.getLevelName(entry['level'])
+        max_level = max(max_level, level if isinstance(level, int) else 0)
+        lines += 1
+    return first_ts, last_ts, max_level, lines
+
+
+class SegmentHandler(logging.Handler):
+    """Écrit les logs d'un bot dans des segments tournants indexés"""
+
+    def __init__(self, user_id: int, log_dir: str = LOG_DIR,
+                 max_bytes: int = MAX_SEGMENT_BYTES, backup_count: int = MAX_SEGMENTS_PER_USER):
+        super().__init__()
+        self.user_id = user_id
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.index = _open_index(log_dir)
+        self.stream = None
+        self.sequence = 0
+        self.hostname = socket.gethostname()
+        self._seal_orphans()
+        self._open_segment()
+
+    def _open_segment(self):
+        self.sequence += 1
+        self.segment = f"bot_{self.user_id}_{int(time.time() * 1000)}_{self.hostname}_{os.getpid()}_{self.sequence}.jsonl"
+        self.stream = open(os.path.join(self.log_dir, self.segment), 'a', encoding='utf-8')
+        self.size = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.max_level = 0
+        self.lines = 0
+        self.last_index_flush = 0.0
+
+    def _flush_index(self, sealed: bool = False, path: Optional[str] = None):
+        if self.first_ts is None:
+            return
+        self._write_index(path or self.segment, self.first_ts, self.last_ts,
+                          self.max_level, self.lines, sealed)
+        self.last_index_flush = time.time()
+
+    def _write_index(self, path: str, first_ts: float, last_ts: float,
+                     max_level: int, lines: int, sealed: bool):
+        self.index.execute("""
+            INSERT INTO segments (path, user_id, first_ts, last_ts, max_level, lines, sealed)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                last_ts = excluded.last_ts,
+                max_level = excluded.max_level,
+                lines = excluded.lines,
+                sealed = excluded.sealed
+        """, (path, self.user_id, first_ts, last_ts, max_level, lines, int(sealed)))
+        self.index.commit()
+
+    def _compress(self, name: str, first_ts: float, last_ts: float, max_level: int, lines: int):
+        """Compresse un segment brut et le remplace dans l'index par sa version .gz"""
+        raw_path = os.path.join(self.log_dir, name)
+        with open(raw_path, 'rb') as src, gzip.open(raw_path + ".gz", 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+        self.index.execute("DELETE FROM segments WHERE path = ?", (name,))
+        self._write_index(name + ".gz", first_ts, last_ts, max_level, lines, sealed=True)
+        os.remove(raw_path)
+
+    def _seal_segment(self):
+        """Ferme, compresse et indexe le segment courant"""
+        self.stream.close()
+        self.stream = None
+        raw_path = os.path.join(self.log_dir, self.segment)
+
+        if self.first_ts is None:
+            os.remove(raw_path)
+            return
+
+        self._compress(self.segment, self.first_ts, self.last_ts, self.max_level, self.lines)
+        self._prune()
+
+    def _seal_orphans(self):
+        """Scelle les segments bruts laissés par un bot tué (SIGKILL, crash)"""
+        prefix = f"bot_{self.user_id}_"
+        for name in os.listdir(self.log_dir):
+            if not (name.startswith(prefix) and name.endswith(".jsonl")):
+                continue
+            # bot_{user_id}_{ms}_{hostname}_{pid}_{seq}.jsonl
+            parts = name[:-len(".jsonl")].split("_")
+            try:
+                pid = int(parts[-2])
+            except (ValueError, IndexError):
+                continue
+            hostname = "_".join(parts[3:-2])
+            path = os.path.join(self.log_dir, name)
+
+            if hostname == self.hostname:
+                if pid == os.getpid() or _pid_alive(pid):
+                    continue
+            elif time.time() - os.path.getmtime(path) < ORPHAN_MAX_AGE:
+                continue
+
+            first_ts, last_ts, max_level, lines = _segment_stats(path)
+            if first_ts is None:
+                os.remove(path)
+                self.index.execute("DELETE FROM segments WHERE path = ?", (name,))
+                self.index.commit()
+            else:
+                self._compress(name, first_ts, last_ts, max_level, lines)
+        self._prune()
+
+    def _prune(self):
+        """Supprime les segments les plus anciens au-delà de backup_count"""
+        old = self.index.execute("""
+            SELECT path FROM segments
+            WHERE user_id = ? AND sealed = 1
+            ORDER BY first_ts DESC
+            LIMIT -1 OFFSET ?
+        """, (self.user_id, self.backup_count)).fetchall()
+        for (path,) in old:
+            try:
+                os.remove(os.path.join(self.log_dir, path))
+            except FileNotFoundError:
+                pass
+            self.index.execute("DELETE FROM segments WHERE path = ?", (path,))
+        self.index.commit()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            line = json.dumps({
+                'ts': record.created,
+                'level': record.levelname,
+                'user_id': self.user_id,
+                'logger': record.name,
+                'message': record.getMessage(),
+            }, ensure_ascii=False) + "\n"
+
+            if self.size and self.size + len(line) > self.max_bytes:
+                self._seal_segment()
+                self._open_segment()
+
+            self.stream.write(line)
+            self.stream.flush()
+            self.size += len(line)
+
+            if self.first_ts is None:
+                self.first_ts = record.created
+            self.last_ts = record.created
+            self.max_level = max(self.max_level, record.levelno)
+            self.lines += 1
+
+            if time.time() - self.last_index_flush >= INDEX_FLUSH_INTERVAL:
+                self._flush_index()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.stream:
+                self._seal_segment()
+            self.index.close()
+        finally:
+            self.release()
+            super().close()
+
+
+def setup_bot_logging(user_id: int, level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """Configure le logging d'un bot : le code appelant ne fait qu'empiler dans une file"""
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    segment_handler = SegmentHandler(user_id)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        log_queue, segment_handler, stream_handler, respect_handler_level=True
+    )
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    listener.start()
+
+    def _shutdown():
+        listener.stop()
+        segment_handler.close()
+
+    atexit.register(_shutdown)
+
+    # Le worker arrête les bots par SIGTERM : sortir proprement pour que atexit scelle le segment
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    return listener
+
+
+def _read_segment(path: str) -> Iterator[str]:
+    """Lignes d'un segment, lues en flux (décompression à la volée)"""
+    opener = gzip.open if path.endswith(".gz") else open
+    try:
+        with opener(path, 'rt', encoding='utf-8') as f:
+            yield from f
+    except FileNotFoundError:
+        return
+
+
+def query_logs(user_id: Optional[int] = None, start: Optional[float] = None,
+               end: Optional[float] = None, min_level: int = logging.NOTSET,
+               limit: int = 200, log_dir: str = LOG_DIR) -> List[Dict]:
+    """Recherche les logs par utilisateur, niveau et plage de temps (plus récents d'abord)"""
+    if not os.path.exists(os.path.join(log_dir, "index.db")):
+        return []
+
+    start = start if start is not None else 0.0
+    end = end if end is not None else time.time()
+
+    sql = """
+        SELECT path, last_ts, sealed FROM segments
+        WHERE first_ts <= ? AND (last_ts >= ? OR sealed = 0) AND (max_level >= ? OR sealed = 0)
+    """
+    params = [end, start, min_level]
+    if user_id is not None:
+        sql += " AND user_id = ?"
+        params.append(user_id)
+    # Segments actifs d'abord (last_ts de l'index en retard), puis du plus récent au plus ancien
+    sql += " ORDER BY sealed ASC, last_ts DESC"
+
+    conn = _open_index(log_dir)
+    try:
+        segments = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+    # Tas des `limit` entrées les plus récentes : (ts, ordre, entrée)
+    kept = []
+    order = 0
+    for path, last_ts, sealed in segments:
+        # Les segments suivants sont tous plus anciens que la plus ancienne entrée gardée
+        if sealed and len(kept) >= limit and last_ts < kept[0][0]:
+            break
+        for line in _read_segment(os.path.join(log_dir, path)):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Ligne en cours d'écriture
+            if not (start <= entry['ts'] <= end) or logging.getLevelName(entry['level']) < min_level:
+                continue
+            order += 1
+            if len(kept) < limit:
+                heapq.heappush(kept, (entry['ts'], order, entry))
+            elif entry['ts'] > kept[0][0]:
+                heapq.heapreplace(kept, (entry['ts'], order, entry))
+
+    return [entry for _, _, entry in sorted(kept, key=lambda item: (item[0], item[1]), reverse=True)]
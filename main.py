@@ -3,47 +3,37 @@ from fastapi import FastAPI, HTTPException, Depends, Request, Form
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Optional
 import hashlib
 import secrets
 import os
-import subprocess
-import json
+import logging
+
+from database import Base, engine, SessionLocal, User, Worker, BotAssignment, DURABLE_TABLES
+from fill_store import FillStore, is_valid_wallet
+from log_store import query_logs
+from sharding import live_workers, publish_assignment, remove_assignment
+from rate_budget import RateBudget
+from tenant_config import record_config_change
+from dashboard_stats import increment, record_daily, rebuild_counters, get_stats, set_user_flag
 
 # Configuration
-DATABASE_URL = "sqlite:///./hyperliquid_saas.db"
 ADMIN_PASSWORD = "admin123"  # Changez ceci !
+USERS_PER_PAGE = 50
 
-# Base de données
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-class User(Base):
-    __tablename__ = "users"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, unique=True, index=True)
-    name = Column(String)
-    wallet_address = Column(String)                   # Wallet principal
-    api_wallet_address = Column(String)               # Adresse API wallet
-    api_public_key = Column(String)                   # Clé publique API
-    api_private_key = Column(String)                  # Clé privée API (UNE SEULE FOIS)
-    telegram_token = Column(String)
-    telegram_chat_id = Column(String)
-    is_active = Column(Boolean, default=False)
-    signum_connected = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    bot_process_id = Column(String, nullable=True)
-
-# TEMPORAIRE : Recréer la base pour les nouveaux champs
-Base.metadata.drop_all(bind=engine)
+# TEMPORAIRE : Recréer la base pour les nouveaux champs (sauf les tables durables)
+Base.metadata.drop_all(bind=engine, tables=[
+    table for table in Base.metadata.sorted_tables if table.name not in DURABLE_TABLES
+])
 Base.metadata.create_all(bind=engine)
 
+# Compteurs du dashboard alignés sur la table users au démarrage
+with SessionLocal() as _db:
+    rebuild_counters(_db)
+
 # Models Pydantic
 class UserCreate(BaseModel):
     email: str
@@ -97,6 +87,9 @@ async def register_user(
     telegram_chat_id: str = Form(...),
     db: Session = Depends(get_db)
 ):
+    if not is_valid_wallet(wallet_address):
+        raise HTTPException(status_code=400, detail="Adresse de wallet invalide (0x + 40 caractères hexadécimaux)")
+    
     # Vérifier si l'utilisateur existe déjà
     existing_user = db.query(User).filter(User.email == email).first()
     if existing_user:
@@ -113,6 +106,8 @@ async def register_user(
     )
     
     db.add(db_user)
+    increment(db, "total_users")
+    record_daily(db, "signups")
     db.commit()
     db.refresh(db_user)
     
@@ -136,34 +131,181 @@ async def admin_login(password: str = Form(...)):
     return response
 
 @app.get("/admin/dashboard", response_class=HTMLResponse)
-async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
+async def admin_dashboard(request: Request, before: Optional[int] = None, db: Session = Depends(get_db)):
     # Vérifier session admin (simplifié)
     if not request.cookies.get("admin_session"):
         return RedirectResponse(url="/admin")
     
-    users = db.query(User).all()
+    # Pagination par clé (id décroissant) : coût constant quelle que soit la page
+    query = db.query(User).order_by(User.id.desc())
+    if before is not None:
+        query = query.filter(User.id < before)
+    users = query.limit(USERS_PER_PAGE + 1).all()
+    next_before = users[USERS_PER_PAGE - 1].id if len(users) > USERS_PER_PAGE else None
     return templates.TemplateResponse("admin_dashboard.html", {
         "request": request, 
-        "users": users
+        "users": users[:USERS_PER_PAGE],
+        "next_before": next_before,
+        "paginated": before is not None,
+        "stats": get_stats(db, days=7)
+    })
+
+@app.get("/admin/stats")
+async def admin_stats(request: Request, db: Session = Depends(get_db)):
+    if not request.cookies.get("admin_session"):
+        raise HTTPException(status_code=401, detail="Non authentifié")
+    
+    return get_stats(db)
+
+@app.get("/admin/logs")
+async def admin_logs(
+    request: Request,
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    level: str = "INFO",
+    limit: int = 200
+):
+    if not request.cookies.get("admin_session"):
+        raise HTTPException(status_code=401, detail="Non authentifié")
+    
+    min_level = logging.getLevelName(level.upper())
+    if not isinstance(min_level, int):
+        raise HTTPException(status_code=400, detail="Niveau de log inconnu")
+    
+    entries = query_logs(
+        user_id=user_id,
+        start=start.timestamp() if start else None,
+        end=end.timestamp() if end else None,
+        min_level=min_level,
+        limit=min(limit, 1000)
+    )
+    return {"count": len(entries), "entries": entries}
+
+@app.get("/admin/stats/{user_id}", response_class=HTMLResponse)
+async def user_stats(
+    request: Request,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    if not request.cookies.get("admin_session"):
+        return RedirectResponse(url="/admin")
+    
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+    
+    # Statistiques calculées sur l'historique local (pas d'appel HyperLiquid)
+    try:
+        store = FillStore(user.wallet_address)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Adresse de wallet invalide")
+    start_ms = int(start.timestamp() * 1000) if start else None
+    end_ms = int(end.timestamp() * 1000) if end else None
+    times, curve = store.pnl_curve(start_ms, end_ms, max_points=200)
+    
+    # Courbe P&L mise à l'échelle pour un SVG 600x200
+    curve_points = ""
+    if len(curve) > 1:
+        x = (times - times[0]) / max(times[-1] - times[0], 1) * 600
+        y = 200 - (curve - curve.min()) / max(curve.max() - curve.min(), 1e-9) * 200
+        curve_points = " ".join(f"{px:.1f},{py:.1f}" for px, py in zip(x, y))
+    
+    return templates.TemplateResponse("stats.html", {
+        "request": request,
+        "user": user,
+        "stats": store.summary(start_ms, end_ms),
+        "curve_points": curve_points
     })
 
+@app.get("/admin/workers")
+async def admin_workers(request: Request, db: Session = Depends(get_db)):
+    if not request.cookies.get("admin_session"):
+        raise HTTPException(status_code=401, detail="Non authentifié")
+    
+    live = set(live_workers(db))
+    workers = []
+    for worker in db.query(Worker).order_by(Worker.worker_id).all():
+        workers.append({
+            "worker_id": worker.worker_id,
+            "hostname": worker.hostname,
+            "pid": worker.pid,
+            "heartbeat_at": worker.heartbeat_at,
+            "alive": worker.worker_id in live,
+            "bots": db.query(BotAssignment).filter(BotAssignment.worker_id == worker.worker_id).count()
+        })
+    pending = db.query(BotAssignment).filter(BotAssignment.worker_id == None).count()
+    return {"workers": workers, "unassigned_bots": pending}
+
+@app.get("/admin/rate-budget")
+async def admin_rate_budget(request: Request):
+    if not request.cookies.get("admin_session"):
+        raise HTTPException(status_code=401, detail="Non authentifié")
+    
+    return RateBudget().status()
+
+@app.post("/admin/config/{user_id}")
+async def update_user_config(
+    request: Request,
+    user_id: int,
+    telegram_chat_id: Optional[str] = Form(None),
+    telegram_token: Optional[str] = Form(None),
+    check_interval: Optional[int] = Form(None),
+    daily_report_time: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    if not request.cookies.get("admin_session"):
+        raise HTTPException(status_code=401, detail="Non authentifié")
+    
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+    
+    if check_interval is not None and check_interval < 5:
+        raise HTTPException(status_code=400, detail="Intervalle minimum: 5 secondes")
+    if daily_report_time is not None:
+        try:
+            # Format normalisé (09:05) : le bot compare l'heure courante en HH:MM
+            daily_report_time = datetime.strptime(daily_report_time, "%H:%M").strftime("%H:%M")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Heure de rapport invalide (HH:MM)")
+    
+    if telegram_chat_id is not None:
+        user.telegram_chat_id = telegram_chat_id
+    if telegram_token is not None:
+        user.telegram_token = telegram_token
+    if check_interval is not None:
+        user.check_interval = check_interval
+    if daily_report_time is not None:
+        user.daily_report_time = daily_report_time
+    
+    # Les bots en cours appliquent le changement sans redémarrage
+    record_config_change(db, user.id)
+    db.commit()
+    
+    return {"message": "Configuration mise à jour"}
+
 @app.post("/admin/activate/{user_id}")
 async def activate_user(user_id: int, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
-    if not user.is_active:
+    if set_user_flag(db, user.id, User.is_active, True):
         # Activer l'utilisateur
-        user.is_active = True
+        increment(db, "active_users")
+        record_daily(db, "activations")
         
-        # Générer et lancer le bot
-        bot_process = create_user_bot(user)
-        if bot_process:
-            user.bot_process_id = str(bot_process.pid)
+        # Publier l'affectation : le worker responsable lance le bot
+        worker_id = publish_assignment(db, user.id)
         
         db.commit()
         
+        if not worker_id:
+            print(f"Aucun worker actif : le bot de {user.email} démarrera avec le prochain worker")
+        
         # Notifier l'utilisateur
         send_activation_notification(user)
     
@@ -175,297 +317,29 @@ async def deactivate_user(user_id: int, db: Session = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
-    if user.is_active:
+    if set_user_flag(db, user.id, User.is_active, False):
         # Désactiver l'utilisateur
-        user.is_active = False
+        increment(db, "active_users", -1)
         
-        # Arrêter le bot
-        if user.bot_process_id:
-            stop_user_bot(user.bot_process_id)
-            user.bot_process_id = None
+        # Arrêter le bot (le worker responsable l'arrête au prochain tour)
+        remove_assignment(db, user.id)
+        user.bot_process_id = None
         
         db.commit()
     
     return {"message": "Utilisateur désactivé et bot arrêté"}
 
-def create_user_bot(user: User):
-    """Crée et lance un bot pour l'utilisateur"""
-    try:
-        # Créer le fichier de configuration du bot
-bot_config = {
-    'TELEGRAM_TOKEN': user.telegram_token,
-    'CHAT_ID': user.telegram_chat_id,
-    'WALLET_ADDRESS': user.wallet_address,
-    'API_WALLET_ADDRESS': user.api_wallet_address,      # ← NOUVEAU
-    'API_PUBLIC_KEY': user.api_public_key,              # ← NOUVEAU
-    'API_PRIVATE_KEY': user.api_private_key,
-    'CHECK_INTERVAL': 30,
-    'DAILY_REPORT_TIME': '23:59',
-}
-        
-        # Créer le dossier pour les bots utilisateurs
-        os.makedirs("user_bots", exist_ok=True)
-        
-        # Sauvegarder la configuration
-        config_path = f"user_bots/config_{user.id}.json"
-        with open(config_path, 'w') as f:
-            json.dump(bot_config, f)
-        
-        # Créer le script du bot personnalisé
-        bot_script_path = f"user_bots/bot_{user.id}.py"
-        create_user_bot_script(bot_script_path, config_path, user.id)
-        
-        # Lancer le bot
-        process = subprocess.Popen([
-            "python", bot_script_path
-        ], cwd=os.getcwd())
-        
-        print(f"Bot lancé pour {user.email} - PID: {process.pid}")
-        return process
-        
-    except Exception as e:
-        print(f"Erreur création bot pour {user.email}: {e}")
-        return None
-
-def create_user_bot_script(script_path: str, config_path: str, user_id: int):
-    """Crée le script du bot personnalisé pour l'utilisateur"""
-    
-    bot_script_content = f'''#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-"""
-Bot HyperLiquid personnalisé - Utilisateur {user_id}
-Généré automatiquement par la plateforme SaaS
-"""
-
-import asyncio
-import json
-import logging
-import os
-import time
-from datetime import datetime
-from typing import Dict, List
-
-import requests
-from hyperliquid.info import Info
-from hyperliquid.utils import constants
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
-
-# Chargement de la configuration
-with open(r"{config_path}", 'r') as f:
-    CONFIG = json.load(f)
-
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f'user_bots/bot_{user_id}.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
-
-class HyperLiquidBot:
-    def __init__(self):
-        self.info = Info(constants.MAINNET_API_URL, skip_ws=True)
-        self.last_known_trades = set()
-        self.daily_stats = self.init_daily_stats()
-        self.bot_start_time = datetime.now()
-        
-    def init_daily_stats(self) -> Dict:
-        return {{
-            'trades_count': 0,
-            'winning_trades': 0,
-            'losing_trades': 0,
-            'total_pnl': 0.0,
-            'total_volume': 0.0,
-            'start_balance': 0.0,
-            'date': datetime.now().strftime('%Y-%m-%d')
-        }}
-
-    def get_user_state(self) -> Dict:
-        """Récupère l'état du compte utilisateur"""
-        try:
-            user_state = self.info.user_state(CONFIG['WALLET_ADDRESS'])
-            return user_state
-        except Exception as e:
-            logger.error(f"Erreur lors de la récupération de l'état utilisateur: {{e}}")
-            return {{}}
-
-    def get_user_fills(self) -> List[Dict]:
-        """Récupère l'historique des trades"""
-        try:
-            fills = self.info.user_fills(CONFIG['WALLET_ADDRESS'])
-            return fills if fills else []
-        except Exception as e:
-            logger.error(f"Erreur lors de la récupération des trades: {{e}}")
-            return []
-
-    def format_trade_notification(self, trade: Dict) -> str:
-        """Formate une notification de trade"""
-        try:
-            side = "🟢 ACHAT" if trade.get('side') == 'B' else "🔴 VENTE"
-            coin = trade.get('coin', 'Unknown')
-            size = float(trade.get('sz', 0))
-            price = float(trade.get('px', 0))
-            total_value = size * price
-            fee = float(trade.get('fee', 0))
-            timestamp = datetime.fromtimestamp(int(trade.get('time', 0)) / 1000)
-            
-            pnl_text = ""
-            if 'closedPnl' in trade:
-                pnl = float(trade['closedPnl'])
-                pnl_emoji = "💰" if pnl > 0 else "💸" if pnl < 0 else "⚖️"
-                pnl_text = f"\\n{{pnl_emoji}} P&L: {{pnl:+.2f}} USDC"
-            
-            message = f"""
-🎯 <b>NOUVEAU TRADE DÉTECTÉ</b>
-
-{{side}} <b>{{coin}}</b>
-📊 Quantité: {{size:.4f}}
-💵 Prix: ${{price:.4f}}
-💰 Valeur: ${{total_value:.2f}}
-⚡ Frais: ${{fee:.4f}}
-🕐 Heure: {{timestamp.strftime('%H:%M:%S')}}{{pnl_text}}
-
-📈 Consultez vos stats avec /status
-            """.strip()
-            
-            return message
-        except Exception as e:
-            logger.error(f"Erreur formatage trade: {{e}}")
-            return f"🚨 Trade détecté (erreur de formatage): {{str(trade)[:100]}}..."
-
-    def check_new_trades(self):
-        """Vérifie s'il y a de nouveaux trades"""
-        try:
-            current_trades = self.get_user_fills()
-            
-            current_trade_ids = set()
-            for trade in current_trades[:10]:
-                trade_id = f"{{trade.get('oid', '')}}-{{trade.get('time', '')}}"
-                current_trade_ids.add(trade_id)
-                
-                if trade_id not in self.last_known_trades:
-                    logger.info(f"Nouveau trade détecté: {{trade_id}}")
-                    message = self.format_trade_notification(trade)
-                    self.send_telegram_message(message)
-                    
-            self.last_known_trades = current_trade_ids
-            
-        except Exception as e:
-            logger.error(f"Erreur vérification trades: {{e}}")
-
-    def send_telegram_message(self, message: str, parse_mode: str = 'HTML'):
-        """Envoie un message via Telegram"""
-        try:
-            url = f"https://api.telegram.org/bot{{CONFIG['TELEGRAM_TOKEN']}}/sendMessage"
-            payload = {{
-                'chat_id': CONFIG['CHAT_ID'],
-                'text': message,
-                'parse_mode': parse_mode
-            }}
-            
-            response = requests.post(url, json=payload)
-            if response.status_code != 200:
-                logger.error(f"Erreur Telegram: {{response.text}}")
-                
-        except Exception as e:
-            logger.error(f"Erreur envoi message: {{e}}")
-
-class TelegramBotHandlers:
-    def __init__(self, hyperliquid_bot: HyperLiquidBot):
-        self.hl_bot = hyperliquid_bot
-
-    async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Commande /start"""
-        welcome_msg = """
-🤖 <b>Votre Bot HyperLiquid Personnel</b>
-
-Bienvenue ! Je surveille vos trades en temps réel.
-
-🔄 Vérification: toutes les 30s
-📊 Rapport quotidien: 23h59
-🚨 Notifications instantanées
-
-Tapez /status pour voir votre portfolio !
-        """.strip()
-        
-        await update.message.reply_text(welcome_msg, parse_mode='HTML')
-
-async def run_scheduled_jobs(hl_bot):
-    """Exécute les tâches programmées"""
-    last_check = 0
-    
-    while True:
-        try:
-            current_time = time.time()
-            
-            if current_time - last_check >= CONFIG['CHECK_INTERVAL']:
-                hl_bot.check_new_trades()
-                last_check = current_time
-            
-            await asyncio.sleep(1)
-            
-        except Exception as e:
-            logger.error(f"Erreur dans les tâches: {{e}}")
-            await asyncio.sleep(5)
-
-async def main():
-    """Fonction principale"""
-    hl_bot = HyperLiquidBot()
-    handlers = TelegramBotHandlers(hl_bot)
-    
-    app = Application.builder().token(CONFIG['TELEGRAM_TOKEN']).build()
-    app.add_handler(CommandHandler("start", handlers.start))
-    
-    startup_msg = f"""
-🚀 <b>VOTRE BOT EST ACTIF !</b>
-
-✅ Surveillance de votre wallet
-📱 Notifications configurées
-🎯 Prêt à tracker vos trades !
-
-Tapez /start pour commencer.
-    """.strip()
-    
-    hl_bot.send_telegram_message(startup_msg)
-    logger.info(f"Bot utilisateur {{user_id}} démarré")
-    
-    await app.initialize()
-    await app.start()
-    await app.updater.start_polling()
-    
-    scheduled_task = asyncio.create_task(run_scheduled_jobs(hl_bot))
+@app.post("/admin/mark-signum-connected/{user_id}")
+async def mark_signum_connected(user_id: int, db: Session = Depends(get_db)):
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
-    try:
-        logger.info("Bot en cours d'exécution...")
-        await scheduled_task
-    except KeyboardInterrupt:
-        logger.info("Arrêt du bot")
-    finally:
-        scheduled_task.cancel()
-        await app.updater.stop()
-        await app.stop()
-        await app.shutdown()
-
-if __name__ == "__main__":
-    asyncio.run(main())
-'''
+    if set_user_flag(db, user.id, User.signum_connected, True):
+        increment(db, "signum_connected")
+        db.commit()
     
-    with open(script_path, 'w', encoding='utf-8') as f:
-        f.write(bot_script_content)
-
-def stop_user_bot(process_id: str):
-    """Arrête le bot de l'utilisateur"""
-    try:
-        import psutil
-        process = psutil.Process(int(process_id))
-        process.terminate()
-        print(f"Bot arrêté - PID: {process_id}")
-    except Exception as e:
-        print(f"Erreur arrêt bot PID {process_id}: {e}")
+    return {"message": "Client marqué comme connecté à Signum"}
 
 def send_activation_notification(user: User):
     """Envoie une notification d'activation à l'utilisateur"""
@@ -0,0 +1,108 @@
+# outbox.py - Outbox durable des notifications Telegram
+"""
+Les notifications sont d'abord écrites dans la table notification_outbox
+(clé d'idempotence unique), puis livrées par lots. Toutes les notifications
+d'un poll sont écrites dans une seule transaction. La livraison est "au moins
+une fois" : un crash entre l'envoi et le commit d'une notification peut
+provoquer un renvoi, jamais une perte.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, NotificationOutbox, upsert
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DELIVERY_BATCH_SIZE = 50
+MAX_ATTEMPTS = 8
+RETRY_BASE_DELAY = 5                # Secondes, doublé à chaque échec
+RETRY_MAX_DELAY = 3600
+RETENTION = timedelta(days=7)       # Lignes envoyées / abandonnées gardées pour la déduplication
+
+
+def _insert_ignore():
+    """INSERT ... ON CONFLICT DO NOTHING sur la clé d'idempotence"""
+    return upsert(NotificationOutbox).on_conflict_do_nothing(index_elements=["idempotency_key"])
+
+
+def enqueue_many(notifications: List[Dict]) -> None:
+    """Écrit des notifications de façon durable, en une transaction"""
+    if not notifications:
+        return
+    now = datetime.utcnow()
+    rows = [{
+        'parse_mode': 'HTML',
+        **notification,
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+    } for notification in notifications]
+
+    db = SessionLocal()
+    try:
+        db.execute(_insert_ignore(), rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Erreur écriture outbox ({len(rows)} notifications): {e}")
+        raise
+    finally:
+        db.close()
+
+
+def enqueue(user_id: int, idempotency_key: str, message: str, parse_mode: str = 'HTML') -> None:
+    enqueue_many([{
+        'user_id': user_id,
+        'idempotency_key': idempotency_key,
+        'message': message,
+        'parse_mode': parse_mode,
+    }])
+
+
+def deliver_pending(send: Callable[[NotificationOutbox], bool], user_id: Optional[int] = None,
+                    batch_size: int = DELIVERY_BATCH_SIZE) -> int:
+    """Livre un lot de notifications en attente ; retourne le nombre envoyé"""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        query = db.query(NotificationOutbox).filter(
+            NotificationOutbox.status == 'pending',
+            NotificationOutbox.next_attempt_at <= now
+        )
+        if user_id is not None:
+            query = query.filter(NotificationOutbox.user_id == user_id)
+        batch = query.order_by(NotificationOutbox.id).limit(batch_size).all()
+
+        sent = 0
+        for notification in batch:
+            if send(notification):
+                notification.status = 'sent'
+                notification.sent_at = datetime.utcnow()
+                sent += 1
+            else:
+                notification.attempts += 1
+                if notification.attempts >= MAX_ATTEMPTS:
+                    notification.status = 'failed'
+                    logger.error(f"Notification {notification.idempotency_key} abandonnée après {notification.attempts} tentatives")
+                else:
+                    delay = min(RETRY_BASE_DELAY * 2 ** notification.attempts, RETRY_MAX_DELAY)
+                    notification.next_attempt_at = now + timedelta(seconds=delay)
+            # Commit après chaque envoi : un crash ne renvoie qu'une notification
+            db.commit()
+        return sent
+    finally:
+        db.close()
+
+
+def purge_outbox(db: Session, retention: timedelta = RETENTION) -> int:
+    """Supprime les notifications terminées plus anciennes que la rétention (sans commit)"""
+    return db.query(NotificationOutbox).filter(
+        NotificationOutbox.status.in_(('sent', 'failed')),
+        NotificationOutbox.created_at < datetime.utcnow() - retention
+    ).delete(synchronize_session=False)
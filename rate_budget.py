@@ -0,0 +1,191 @@
+# rate_budget.py - Budget de poids de requêtes HyperLiquid partagé par toute la flotte
+"""
+HyperLiquid limite le poids des requêtes par IP sur une fenêtre glissante.
+Tous les bots et workers partagent la même IP de sortie : le budget est donc
+tenu en base (buckets d'une seconde) et consulté avant chaque requête.
+
+- Les polls de fond ne peuvent consommer que BACKGROUND_SHARE du budget ;
+  le reste est réservé aux requêtes interactives (/status).
+- Un 429 ou une erreur 5xx ouvre un disjoncteur avec backoff exponentiel :
+  plus aucune requête ne part tant qu'il est ouvert.
+"""
+
+import logging
+import time
+from typing import Callable, Dict, Optional, TypeVar
+
+from database import SessionLocal, RateBudgetBucket, RateBudgetCircuit, upsert
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Configuration
+WEIGHT_LIMIT = 1200             # Poids max par fenêtre et par IP
+WINDOW_SECONDS = 60
+BACKGROUND_SHARE = 0.8          # Part du budget accessible aux polls de fond
+CIRCUIT_BASE_DELAY = 5          # Secondes, doublé à chaque échec consécutif
+CIRCUIT_MAX_DELAY = 300
+RETRY_SLEEP = 0.25
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Poids des endpoints /info utilisés
+REQUEST_WEIGHTS = {
+    'user_state': 2,
+    'all_mids': 2,
+    'user_fills': 20,
+}
+
+
+class BudgetUnavailable(Exception):
+    """Pas de budget disponible (ou disjoncteur ouvert) dans le délai imparti"""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """Code HTTP d'une erreur du SDK HyperLiquid ou de requests"""
+    status = getattr(error, 'status_code', None)
+    if status is None and getattr(error, 'response', None) is not None:
+        status = getattr(error.response, 'status_code', None)
+    return status
+
+
+class RateBudget:
+    def __init__(self, limit: int = WEIGHT_LIMIT, window: int = WINDOW_SECONDS,
+                 background_share: float = BACKGROUND_SHARE):
+        self.limit = limit
+        self.window = window
+        self.background_share = background_share
+        self.last_cleanup = 0.0
+        self.failures_seen = 0      # Échecs consécutifs lus avec le disjoncteur (ou enregistrés ici)
+
+    def _cap(self, priority: int) -> int:
+        if priority == PRIORITY_INTERACTIVE:
+            return self.limit
+        return int(self.limit * self.background_share)
+
+    def _used(self, db, now: int) -> int:
+        total = db.query(RateBudgetBucket.weight).filter(
+            RateBudgetBucket.second > now - self.window
+        ).all()
+        return sum(row.weight for row in total)
+
+    def _circuit(self, db) -> RateBudgetCircuit:
+        circuit = db.query(RateBudgetCircuit).filter(RateBudgetCircuit.id == 1).first()
+        if not circuit:
+            circuit = RateBudgetCircuit(id=1, failures=0, open_until=0.0)
+            db.add(circuit)
+        return circuit
+
+    def _try_reserve(self, weight: int, priority: int) -> float:
+        """Réserve le poids ; retourne 0 si accordé, sinon le délai conseillé"""
+        db = SessionLocal()
+        try:
+            circuit = db.query(RateBudgetCircuit).filter(RateBudgetCircuit.id == 1).first()
+            self.failures_seen = circuit.failures if circuit else 0
+            if circuit and circuit.open_until > time.time():
+                return circuit.open_until - time.time()
+
+            now = int(time.time())
+            # Réserver d'abord puis vérifier : deux processus ne peuvent pas dépasser le budget
+            stmt = upsert(RateBudgetBucket).values(second=now, weight=weight)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['second'],
+                set_={'weight': RateBudgetBucket.weight + stmt.excluded.weight}
+            )
+            db.execute(stmt)
+            if now - self.last_cleanup >= self.window:
+                # Nettoyage des buckets sortis de la fenêtre
+                db.query(RateBudgetBucket).filter(RateBudgetBucket.second <= now - self.window).delete()
+                self.last_cleanup = now
+            db.commit()
+
+            if self._used(db, now) <= self._cap(priority):
+                return 0.0
+
+            db.query(RateBudgetBucket).filter(RateBudgetBucket.second == now).update(
+                {RateBudgetBucket.weight: RateBudgetBucket.weight - weight}
+            )
+            db.commit()
+            return RETRY_SLEEP
+        finally:
+            db.close()
+
+    def acquire(self, weight: int, priority: int = PRIORITY_BACKGROUND, timeout: float = 5.0) -> bool:
+        """Attend (au plus timeout secondes) que le budget permette la requête"""
+        deadline = time.time() + timeout
+        while True:
+            delay = self._try_reserve(weight, priority)
+            if delay <= 0:
+                return True
+            if time.time() + delay > deadline:
+                return False
+            time.sleep(delay)
+
+    def record_success(self):
+        # Cas courant : aucun échec en cours, pas de requête sur le disjoncteur
+        if not self.failures_seen:
+            return
+        self.failures_seen = 0
+        db = SessionLocal()
+        try:
+            circuit = db.query(RateBudgetCircuit).filter(RateBudgetCircuit.id == 1).first()
+            if circuit and circuit.failures:
+                circuit.failures = 0
+                circuit.last_error = None
+                db.commit()
+        finally:
+            db.close()
+
+    def record_failure(self, status_code: int, detail: str = ""):
+        """Ouvre le disjoncteur après un 429 / 5xx"""
+        db = SessionLocal()
+        try:
+            circuit = self._circuit(db)
+            circuit.failures = (circuit.failures or 0) + 1
+            delay = min(CIRCUIT_BASE_DELAY * 2 ** (circuit.failures - 1), CIRCUIT_MAX_DELAY)
+            circuit.open_until = max(circuit.open_until or 0.0, time.time() + delay)
+            circuit.last_error = f"{status_code} {detail}"[:200]
+            db.commit()
+            self.failures_seen = circuit.failures
+            logger.warning(f"HyperLiquid {status_code} : disjoncteur ouvert pour {delay}s")
+        finally:
+            db.close()
+
+    def call(self, fn: Callable[[], T], weight: int, priority: int = PRIORITY_BACKGROUND,
+             timeout: float = 5.0) -> T:
+        """Exécute une requête HyperLiquid dans le budget de la flotte"""
+        if not self.acquire(weight, priority, timeout):
+            raise BudgetUnavailable(f"Budget HyperLiquid indisponible (poids {weight})")
+        try:
+            result = fn()
+        except Exception as e:
+            status = _status_code(e)
+            if status is not None and (status == 429 or status >= 500):
+                self.record_failure(status, str(e))
+            raise
+        self.record_success()
+        return result
+
+    def status(self) -> Dict:
+        """Budget restant et état du disjoncteur"""
+        db = SessionLocal()
+        try:
+            now = int(time.time())
+            used = self._used(db, now)
+            circuit = db.query(RateBudgetCircuit).filter(RateBudgetCircuit.id == 1).first()
+            open_until = circuit.open_until if circuit else 0.0
+            return {
+                'limit': self.limit,
+                'window_seconds': self.window,
+                'used': used,
+                'remaining': max(self.limit - used, 0),
+                'remaining_background': max(self._cap(PRIORITY_BACKGROUND) - used, 0),
+                'circuit_open': open_until > time.time(),
+                'circuit_open_until': open_until,
+                'consecutive_failures': circuit.failures if circuit else 0,
+                'last_error': circuit.last_error if circuit else None,
+            }
+        finally:
+            db.close()
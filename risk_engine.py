@@ -0,0 +1,482 @@
+# risk_engine.py - Alertes de liquidation et de marge pour tous les utilisateurs
+"""
+Les positions de tous les utilisateurs d'un worker sont tenues dans des
+tableaux NumPy (une ligne par utilisateur/coin). Elles sont resynchronisées
+par des snapshots user_state et mises à jour entre deux snapshots par les
+fills de l'historique local (fill_store). À chaque mise à jour des prix mid,
+distance à la liquidation et ratio de marge sont recalculés en une passe
+vectorisée ; les alertes passent par l'outbox, avec hystérésis. L'état des
+alertes (armée / déclenchée, numéro d'épisode) est conservé en base pour ne pas
+renvoyer une alerte après un redémarrage ou un rééquilibrage.
+
+Approximation : la marge de maintenance d'un utilisateur est répartie au
+prorata du notionnel (crossMaintenanceMarginUsed / notionnel du snapshot).
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from database import SessionLocal, RiskAlertState, upsert
+from fill_store import FillStore
+from outbox import enqueue_many
+from rate_budget import RateBudget, BudgetUnavailable, REQUEST_WEIGHTS
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LIQUIDATION_ALERT_DISTANCE = 0.10    # Alerte à moins de 10 % du prix de liquidation
+LIQUIDATION_REARM_DISTANCE = 0.15    # Réarmement au-delà de 15 % (hystérésis)
+MARGIN_ALERT_RATIO = 0.80            # Marge de maintenance / valeur du compte
+MARGIN_REARM_RATIO = 0.70
+MIDS_INTERVAL = 5                    # Secondes entre deux mises à jour des prix
+SNAPSHOT_INTERVAL = 300              # Resynchronisation complète d'un utilisateur
+SNAPSHOTS_PER_TICK = 10              # Limite les user_state par tour (budget de la flotte)
+FILL_RESYNC_DELAY = 30               # Snapshot anticipé après des fills (prix de liquidation)
+SNAPSHOT_RETRY_DELAY = 60
+
+INITIAL_CAPACITY = 256
+
+
+def _grow(array: np.ndarray, size: int, fill) -> np.ndarray:
+    if size <= len(array):
+        return array
+    grown = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class RiskEngine:
+    def __init__(self,
+                 liquidation_alert: float = LIQUIDATION_ALERT_DISTANCE,
+                 liquidation_rearm: float = LIQUIDATION_REARM_DISTANCE,
+                 margin_alert: float = MARGIN_ALERT_RATIO,
+                 margin_rearm: float = MARGIN_REARM_RATIO):
+        self.liquidation_alert = liquidation_alert
+        self.liquidation_rearm = liquidation_rearm
+        self.margin_alert = margin_alert
+        self.margin_rearm = margin_rearm
+
+        self.coins: Dict[str, int] = {}
+        self.users: Dict[int, int] = {}            # user_id -> index utilisateur
+        self.user_ids = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.account_value = np.zeros(INITIAL_CAPACITY)
+        self.maintenance_rate = np.zeros(INITIAL_CAPACITY)   # Marge de maintenance / notionnel
+        self.margin_alerted = np.zeros(INITIAL_CAPACITY, dtype=bool)
+
+        self.rows: Dict[tuple, int] = {}           # (index utilisateur, index coin) -> ligne
+        self.pos_user = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.pos_coin = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self.szi = np.zeros(INITIAL_CAPACITY)               # Taille signée
+        self.snapshot_px = np.full(INITIAL_CAPACITY, np.nan)  # Prix de référence de account_value
+        self.liquidation_px = np.full(INITIAL_CAPACITY, np.nan)
+        self.liquidation_alerted = np.zeros(INITIAL_CAPACITY, dtype=bool)
+
+    def _coin(self, coin: str) -> int:
+        return self.coins.setdefault(coin, len(self.coins))
+
+    def _user(self, user_id: int) -> int:
+        if user_id not in self.users:
+            index = len(self.users)
+            self.users[user_id] = index
+            self.user_ids = _grow(self.user_ids, index + 1, 0)
+            self.account_value = _grow(self.account_value, index + 1, 0.0)
+            self.maintenance_rate = _grow(self.maintenance_rate, index + 1, 0.0)
+            self.margin_alerted = _grow(self.margin_alerted, index + 1, False)
+            self.user_ids[index] = user_id
+        return self.users[user_id]
+
+    def _row(self, user_index: int, coin: str) -> int:
+        key = (user_index, self._coin(coin))
+        if key not in self.rows:
+            row = len(self.rows)
+            self.rows[key] = row
+            self.pos_user = _grow(self.pos_user, row + 1, 0)
+            self.pos_coin = _grow(self.pos_coin, row + 1, 0)
+            self.szi = _grow(self.szi, row + 1, 0.0)
+            self.snapshot_px = _grow(self.snapshot_px, row + 1, np.nan)
+            self.liquidation_px = _grow(self.liquidation_px, row + 1, np.nan)
+            self.liquidation_alerted = _grow(self.liquidation_alerted, row + 1, False)
+            self.pos_user[row], self.pos_coin[row] = key
+        return self.rows[key]
+
+    def _user_rows(self, user_index: int) -> np.ndarray:
+        count = len(self.rows)
+        return np.flatnonzero(self.pos_user[:count] == user_index)
+
+    def apply_snapshot(self, user_id: int, user_state: Dict):
+        """Resynchronise les positions d'un utilisateur depuis user_state"""
+        user_index = self._user(user_id)
+        rows = self._user_rows(user_index)
+        self.szi[rows] = 0.0
+        self.liquidation_px[rows] = np.nan
+
+        notional = 0.0
+        for asset_position in user_state.get('assetPositions', []):
+            position = asset_position.get('position', {})
+            size = float(position.get('szi', 0) or 0)
+            if size == 0:
+                continue
+            row = self._row(user_index, position.get('coin', 'Unknown'))
+            value = float(position.get('positionValue', 0) or 0)
+            liquidation = position.get('liquidationPx')
+            self.szi[row] = size
+            self.snapshot_px[row] = value / abs(size) if value else float(position.get('entryPx', 0) or 0)
+            self.liquidation_px[row] = float(liquidation) if liquidation else np.nan
+            notional += abs(value)
+
+        summary = user_state.get('crossMarginSummary') or user_state.get('marginSummary', {})
+        self.account_value[user_index] = float(summary.get('accountValue', 0) or 0)
+        maintenance = float(user_state.get('crossMaintenanceMarginUsed', 0) or 0)
+        self.maintenance_rate[user_index] = maintenance / notional if notional else 0.0
+
+    def apply_fills(self, user_id: int, fills: np.ndarray, coins: List[str]):
+        """Met à jour tailles et valeur du compte depuis des fills (format FILL_DTYPE) postérieurs au snapshot
+
+        Le prix de liquidation reste celui du dernier snapshot : l'appelant doit
+        demander une resynchronisation rapide (voir RiskMonitor._apply_new_fills).
+        """
+        if not len(fills):
+            return
+        user_index = self._user(user_id)
+        reference_px = np.zeros(len(coins))
+        for coin_id in np.unique(fills['coin']):
+            row = self._row(user_index, coins[coin_id])
+            if np.isnan(self.snapshot_px[row]):
+                # Nouvelle position : prix de référence = premier prix d'exécution
+                self.snapshot_px[row] = fills['px'][fills['coin'] == coin_id][0]
+            reference_px[coin_id] = self.snapshot_px[row]
+
+        delta = fills['side'] * fills['sz']
+        sizes = np.bincount(fills['coin'], weights=delta, minlength=len(coins))
+        for coin_id in np.flatnonzero(sizes):
+            self.szi[self.rows[(user_index, self.coins[coins[coin_id]])]] += sizes[coin_id]
+
+        # Chaque fill gagne (mark - px) ; ramené au prix de référence de account_value
+        self.account_value[user_index] -= float(
+            (delta * (fills['px'] - reference_px[fills['coin']])).sum() + fills['fee'].sum()
+        )
+
+    def _set_alerted(self, user_id: int, kind: str, coin: str, alerted: bool):
+        user_index = self._user(user_id)
+        if kind == 'margin':
+            self.margin_alerted[user_index] = alerted
+        else:
+            self.liquidation_alerted[self._row(user_index, coin)] = alerted
+
+    def restore_alert(self, user_id: int, kind: str, coin: str = ''):
+        """Marque une alerte comme déjà envoyée (état relu en base)"""
+        self._set_alerted(user_id, kind, coin, True)
+
+    def clear_alert(self, user_id: int, kind: str, coin: str = ''):
+        """Annule un déclenchement non notifié : l'alerte repart au prochain evaluate"""
+        self._set_alerted(user_id, kind, coin, False)
+
+    def remove_user(self, user_id: int):
+        user_index = self.users.get(user_id)
+        if user_index is None:
+            return
+        rows = self._user_rows(user_index)
+        self.szi[rows] = 0.0
+        self.liquidation_px[rows] = np.nan
+        self.liquidation_alerted[rows] = False
+        self.account_value[user_index] = 0.0
+        self.maintenance_rate[user_index] = 0.0
+        self.margin_alerted[user_index] = False
+
+    def evaluate(self, mids: Dict[str, float]) -> Tuple[List[Dict], List[Dict]]:
+        """Passe vectorisée sur toutes les positions ; retourne (nouvelles alertes, réarmements)"""
+        count = len(self.rows)
+        user_count = len(self.users)
+        if not count:
+            return [], []
+
+        prices = np.full(len(self.coins), np.nan)
+        for coin, index in self.coins.items():
+            if coin in mids:
+                prices[index] = float(mids[coin])
+
+        user = self.pos_user[:count]
+        szi = self.szi[:count]
+        px = prices[self.pos_coin[:count]]
+        liquidation_px = self.liquidation_px[:count]
+        alerted = self.liquidation_alerted[:count]
+        priced = ~np.isnan(px)
+        open_position = (szi != 0) & priced
+        # Utilisateurs dont une position n'a pas de prix : ratio de marge inconnu
+        unpriced = np.bincount(user, weights=(szi != 0) & ~priced, minlength=user_count) > 0
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            distance = np.abs(px - liquidation_px) / px
+
+            # Sans prix, l'état de l'alerte ne change pas
+            liquidation_trigger = open_position & (distance < self.liquidation_alert) & ~alerted
+            liquidation_rearm = alerted & priced & ((szi == 0) | ~(distance <= self.liquidation_rearm))
+            alerted[liquidation_trigger] = True
+            alerted[liquidation_rearm] = False
+
+            live_px = np.where(open_position, px, 0.0)
+            pnl_delta = np.where(open_position, szi * (live_px - np.nan_to_num(self.snapshot_px[:count])), 0.0)
+            notional = np.abs(szi) * live_px
+            equity = self.account_value[:user_count] + np.bincount(user, weights=pnl_delta, minlength=user_count)
+            maintenance = self.maintenance_rate[:user_count] * np.bincount(user, weights=notional, minlength=user_count)
+            margin_ratio = np.where(equity > 0, maintenance / equity, np.inf)
+            margin_ratio = np.where(maintenance > 0, margin_ratio, 0.0)
+
+        margin_alerted = self.margin_alerted[:user_count]
+        margin_trigger = (margin_ratio >= self.margin_alert) & ~margin_alerted & ~unpriced
+        margin_rearm = margin_alerted & (margin_ratio < self.margin_rearm) & ~unpriced
+        margin_alerted[margin_trigger] = True
+        margin_alerted[margin_rearm] = False
+
+        coin_names = {index: coin for coin, index in self.coins.items()}
+        alerts = []
+        for row in np.flatnonzero(liquidation_trigger):
+            alerts.append({
+                'kind': 'liquidation',
+                'user_id': int(self.user_ids[user[row]]),
+                'coin': coin_names[self.pos_coin[row]],
+                'size': float(szi[row]),
+                'price': float(px[row]),
+                'liquidation_px': float(liquidation_px[row]),
+                'distance': float(distance[row]),
+            })
+        for user_index in np.flatnonzero(margin_trigger):
+            alerts.append({
+                'kind': 'margin',
+                'user_id': int(self.user_ids[user_index]),
+                'coin': '',
+                'margin_ratio': float(margin_ratio[user_index]),
+                'equity': float(equity[user_index]),
+            })
+
+        rearms = [
+            {'kind': 'liquidation', 'user_id': int(self.user_ids[user[row]]), 'coin': coin_names[self.pos_coin[row]]}
+            for row in np.flatnonzero(liquidation_rearm)
+        ] + [
+            {'kind': 'margin', 'user_id': int(self.user_ids[user_index]), 'coin': ''}
+            for user_index in np.flatnonzero(margin_rearm)
+        ]
+        return alerts, rearms
+
+
+def format_risk_alert(alert: Dict) -> str:
+    """Message Telegram d'une alerte de risque"""
+    if alert['kind'] == 'liquidation':
+        direction = "LONG" if alert['size'] > 0 else "SHORT"
+        return f"""
+🚨 <b>RISQUE DE LIQUIDATION</b>
+
+{direction} <b>{alert['coin']}</b> ({abs(alert['size']):.4f})
+💵 Prix actuel: ${alert['price']:.4f}
+☠️ Liquidation: ${alert['liquidation_px']:.4f}
+📉 Distance: {alert['distance'] * 100:.1f}%
+
+Pensez à réduire la position ou à ajouter de la marge.
+        """.strip()
+
+    return f"""
+⚠️ <b>MARGE CRITIQUE</b>
+
+📊 Marge de maintenance: {alert['margin_ratio'] * 100:.0f}% de la valeur du compte
+💰 Valeur estimée: ${alert['equity']:.2f}
+
+Pensez à réduire vos positions ou à ajouter de la marge.
+    """.strip()
+
+
+class RiskMonitor:
+    """Fait tourner le RiskEngine pour les utilisateurs d'un worker"""
+
+    def __init__(self, engine: Optional[RiskEngine] = None, info=None):
+        if info is None:
+            from hyperliquid.info import Info
+            from hyperliquid.utils import constants
+
+            info = Info(constants.MAINNET_API_URL, skip_ws=True)
+        self.info = info
+        self.engine = engine or RiskEngine()
+        self.rate_budget = RateBudget()
+        self.wallets: Dict[int, str] = {}
+        self.fill_stores: Dict[int, FillStore] = {}
+        self.last_snapshot: Dict[int, float] = {}
+        self.next_snapshot: Dict[int, float] = {}
+        self.last_fill_time: Dict[int, int] = {}
+        self.alert_state: Dict[int, Dict[tuple, list]] = {}   # user_id -> (kind, coin) -> [épisode, déclenchée]
+        self.pending_wallets: Optional[Dict[int, str]] = None
+        self.lock = threading.Lock()                          # Protège seulement pending_wallets
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set_users(self, wallets: Dict[int, str]):
+        """Utilisateurs suivis (user_id -> wallet), appliqués au prochain tour de surveillance"""
+        # Ne bloque pas le worker pendant les appels réseau d'un tour en cours
+        with self.lock:
+            self.pending_wallets = dict(wallets)
+
+    def _apply_users(self):
+        with self.lock:
+            wallets, self.pending_wallets = self.pending_wallets, None
+        if wallets is None:
+            return
+        try:
+            self._load_alert_state(set(wallets) - set(self.alert_state))
+        except Exception:
+            # Base indisponible : ensemble réessayé au tour suivant (sauf s'il a été remplacé)
+            with self.lock:
+                if self.pending_wallets is None:
+                    self.pending_wallets = wallets
+            raise
+        for user_id in set(self.wallets) - set(wallets):
+            self.engine.remove_user(user_id)
+            self.fill_stores.pop(user_id, None)
+            self.last_snapshot.pop(user_id, None)
+            self.next_snapshot.pop(user_id, None)
+            self.last_fill_time.pop(user_id, None)
+            self.alert_state.pop(user_id, None)
+        for user_id, wallet in wallets.items():
+            if self.wallets.get(user_id) != wallet:
+                self.fill_stores[user_id] = FillStore(wallet)
+                self.last_snapshot.pop(user_id, None)
+                self.next_snapshot.pop(user_id, None)
+        self.wallets = wallets
+
+    def _load_alert_state(self, user_ids):
+        if not user_ids:
+            return
+        db = SessionLocal()
+        try:
+            rows = db.query(RiskAlertState).filter(RiskAlertState.user_id.in_(list(user_ids))).all()
+        finally:
+            db.close()
+        for user_id in user_ids:
+            self.alert_state[user_id] = {}
+        for row in rows:
+            self.alert_state[row.user_id][(row.kind, row.coin)] = [row.episode, row.alerted]
+
+    def _update_alert_state(self, event: Dict, alerted: bool) -> Dict:
+        """Nouvel épisode à chaque déclenchement ; retourne la ligne risk_alert_state"""
+        state = self.alert_state.setdefault(event['user_id'], {}).setdefault((event['kind'], event['coin']), [0, False])
+        if alerted:
+            state[0] += 1
+        state[1] = alerted
+        return {'user_id': event['user_id'], 'kind': event['kind'], 'coin': event['coin'],
+                'episode': state[0], 'alerted': alerted}
+
+    def _save_alert_state(self, rows: List[Dict]):
+        """Écrit l'état des alertes modifiées (après l'outbox : au pire un doublon dédupliqué)"""
+        stmt = upsert(RiskAlertState)
+        db = SessionLocal()
+        try:
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=['user_id', 'kind', 'coin'],
+                set_={'episode': stmt.excluded.episode, 'alerted': stmt.excluded.alerted}
+            ), rows)
+            db.commit()
+        finally:
+            db.close()
+
+    def _refresh_snapshots(self):
+        now = time.time()
+        due = sorted(
+            (self.next_snapshot.get(user_id, 0.0), user_id)
+            for user_id in self.wallets
+            if self.next_snapshot.get(user_id, 0.0) <= now
+        )[:SNAPSHOTS_PER_TICK]
+        for _, user_id in due:
+            try:
+                user_state = self.rate_budget.call(
+                    lambda: self.info.user_state(self.wallets[user_id]),
+                    weight=REQUEST_WEIGHTS['user_state']
+                )
+                self.engine.apply_snapshot(user_id, user_state)
+            except BudgetUnavailable as e:
+                logger.warning(f"Snapshots de risque reportés: {e}")
+                break
+            except Exception as e:
+                logger.error(f"Erreur snapshot de risque utilisateur {user_id}: {e}")
+                self.next_snapshot[user_id] = now + SNAPSHOT_RETRY_DELAY
+                continue
+
+            if user_id not in self.last_snapshot:
+                # Premier snapshot : alertes déjà envoyées avant un redémarrage / rééquilibrage
+                for (kind, coin), (_, alerted) in self.alert_state.get(user_id, {}).items():
+                    if alerted:
+                        self.engine.restore_alert(user_id, kind, coin)
+            self.last_snapshot[user_id] = now
+            self.next_snapshot[user_id] = now + SNAPSHOT_INTERVAL
+            # Les fills antérieurs sont inclus dans le snapshot
+            self.last_fill_time[user_id] = int(now * 1000)
+
+    def _apply_new_fills(self):
+        now = time.time()
+        for user_id, store in self.fill_stores.items():
+            if user_id not in self.last_snapshot:
+                continue
+            try:
+                since = self.last_fill_time.get(user_id, 0)
+                fills = store.range(since + 1, None)
+                if len(fills):
+                    self.engine.apply_fills(user_id, fills, store.coins)
+                    self.last_fill_time[user_id] = int(fills['time'][-1])
+                    # Taille modifiée : prix de liquidation à resynchroniser rapidement
+                    self.next_snapshot[user_id] = min(self.next_snapshot.get(user_id, 0.0), now + FILL_RESYNC_DELAY)
+            except Exception as e:
+                logger.error(f"Erreur fills de risque utilisateur {user_id}: {e}")
+
+    def _enqueue_alerts(self, alerts: List[Dict]):
+        """Met les alertes dans l'outbox ; en cas d'échec, elles se redéclencheront au prochain tour"""
+        for alert in alerts:
+            # Clé d'idempotence par épisode : une seule notification par déclenchement
+            episode, _ = self.alert_state.get(alert['user_id'], {}).get((alert['kind'], alert['coin']), [0, False])
+            alert['episode'] = episode + 1
+        try:
+            enqueue_many([{
+                'user_id': alert['user_id'],
+                'idempotency_key': f"risk:{alert['kind']}:{alert['user_id']}:{alert['coin']}:{alert['episode']}",
+                'message': format_risk_alert(alert),
+            } for alert in alerts])
+        except Exception:
+            for alert in alerts:
+                self.engine.clear_alert(alert['user_id'], alert['kind'], alert['coin'])
+            raise
+
+    def tick(self):
+        self._apply_users()
+        if not self.wallets:
+            return
+        self._refresh_snapshots()
+        self._apply_new_fills()
+        mids = self.rate_budget.call(self.info.all_mids, weight=REQUEST_WEIGHTS['all_mids'])
+        alerts, rearms = self.engine.evaluate(mids)
+
+        changed = [self._update_alert_state(rearm, alerted=False) for rearm in rearms]
+        try:
+            if alerts:
+                self._enqueue_alerts(alerts)
+                # Épisode et état « déclenchée » seulement une fois l'alerte dans l'outbox
+                changed += [self._update_alert_state(alert, alerted=True) for alert in alerts]
+                logger.info(f"{len(alerts)} alertes de risque envoyées")
+        finally:
+            if changed:
+                self._save_alert_state(changed)
+
+    def _run(self):
+        while not self._stop.wait(MIDS_INTERVAL):
+            try:
+                self.tick()
+            except BudgetUnavailable as e:
+                logger.warning(f"Surveillance du risque reportée: {e}")
+            except Exception as e:
+                logger.error(f"Erreur surveillance du risque: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="risk-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,104 @@
+# sharding.py - Répartition des utilisateurs entre workers (hachage cohérent)
+import bisect
+import hashlib
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Worker, BotAssignment, upsert
+
+# Configuration
+HEARTBEAT_TTL = 15          # Secondes sans heartbeat avant qu'un worker soit considéré mort
+VIRTUAL_NODES = 100         # Points par worker sur l'anneau
+FENCE_INTERVAL = 10         # Secondes entre deux vérifications de son affectation par un bot
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Anneau de hachage cohérent : un worker qui arrive ou part ne déplace que sa part"""
+
+    def __init__(self, nodes: Iterable[str], virtual_nodes: int = VIRTUAL_NODES):
+        self.nodes = sorted(set(nodes))
+        self.ring = sorted(
+            (_hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(virtual_nodes)
+        )
+        self.keys = [h for h, _ in self.ring]
+
+    def get(self, user_id: int) -> Optional[str]:
+        """Worker responsable de l'utilisateur (None si aucun worker)"""
+        if not self.ring:
+            return None
+        index = bisect.bisect(self.keys, _hash(f"user:{user_id}")) % len(self.ring)
+        return self.ring[index][1]
+
+
+def live_workers(db: Session, ttl: int = HEARTBEAT_TTL) -> List[str]:
+    """Workers ayant envoyé un heartbeat récemment"""
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    rows = db.query(Worker.worker_id).filter(Worker.heartbeat_at >= cutoff).all()
+    return [row.worker_id for row in rows]
+
+
+def publish_assignment(db: Session, user_id: int) -> Optional[str]:
+    """Publie le worker responsable d'un utilisateur activé (sans commit)"""
+    worker_id = HashRing(live_workers(db)).get(user_id)
+    assignment = db.query(BotAssignment).filter(BotAssignment.user_id == user_id).first()
+    if not assignment:
+        assignment = BotAssignment(user_id=user_id)
+        db.add(assignment)
+    if assignment.worker_id != worker_id:
+        assignment.worker_id = worker_id
+        assignment.bot_pid = None
+    assignment.updated_at = datetime.utcnow()
+    return worker_id
+
+
+def remove_assignment(db: Session, user_id: int):
+    """Retire l'affectation d'un utilisateur désactivé (sans commit)"""
+    db.query(BotAssignment).filter(BotAssignment.user_id == user_id).delete()
+
+
+def claim_assignment(db: Session, user_id: int, worker_id: str, hostname: str, workers: List[str]) -> bool:
+    """Prend l'affectation si aucun autre worker vivant n'y fait tourner de bot (avec commit)"""
+    db.execute(upsert(BotAssignment).values(user_id=user_id).on_conflict_do_nothing(index_elements=['user_id']))
+    claimed = db.query(BotAssignment).filter(
+        BotAssignment.user_id == user_id,
+        or_(
+            BotAssignment.worker_id == None,
+            BotAssignment.worker_id == worker_id,
+            BotAssignment.bot_pid == None,
+            BotAssignment.worker_id.notin_(workers),
+        )
+    ).update({
+        BotAssignment.worker_id: worker_id,
+        BotAssignment.hostname: hostname,
+        BotAssignment.updated_at: datetime.utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def release_assignments(db: Session, user_ids: List[int], worker_id: str):
+    """Libère les affectations de bots arrêtés, si elles sont toujours à ce worker (sans commit)"""
+    db.query(BotAssignment).filter(
+        BotAssignment.user_id.in_(user_ids),
+        BotAssignment.worker_id == worker_id
+    ).update({BotAssignment.worker_id: None, BotAssignment.bot_pid: None}, synchronize_session=False)
+
+
+def still_assigned(user_id: int, worker_id: str, hostname: str, pid: int) -> bool:
+    """Vérifié par chaque bot : faux si un autre worker (ou processus) a repris l'utilisateur"""
+    db = SessionLocal()
+    try:
+        assignment = db.query(BotAssignment).filter(BotAssignment.user_id == user_id).first()
+    finally:
+        db.close()
+    return (assignment is not None and assignment.worker_id == worker_id
+            and assignment.hostname == hostname and assignment.bot_pid in (None, pid))
@@ -24,5 +24,10 @@ pip install -r requirements.txt
 echo "Initialisation de la base de donnees..."
 python -c "from main import Base, engine; Base.metadata.create_all(bind=engine); print('Base de donnees initialisee')"
 
+echo "Lancement du worker des bots..."
+python worker.py &
+WORKER_PID=$!
+trap "kill $WORKER_PID" EXIT
+
 echo "Lancement du serveur..."
 python main.py
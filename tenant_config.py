@@ -0,0 +1,212 @@
+# tenant_config.py - Registre en mémoire de la configuration des utilisateurs
+"""
+Chaque worker tient un registre pour sa part des utilisateurs (chargée avec
+la requête de rééquilibrage) et suit la table tenant_config_changes (curseur
+seq) : un seul poll par worker, pas par bot. Les modifications sont poussées
+à chaque bot sur son stdin (une ligne JSON par version) ; côté bot,
+ConfigStream met à jour le dictionnaire de config en place, sans redémarrage.
+"""
+
+import json
+import logging
+import sys
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, TextIO
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, User, TenantConfigChange
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+POLL_INTERVAL = 0.5         # Secondes entre deux lectures du journal des changements
+JOURNAL_RETENTION = timedelta(days=1)
+DEFAULT_CHECK_INTERVAL = 30
+DEFAULT_DAILY_REPORT_TIME = '23:59'
+
+ConfigListener = Callable[[int, Dict, Dict], None]
+
+
+def tenant_config(user: User) -> Dict:
+    """Configuration d'un bot (mêmes clés que l'ancien config_{id}.json)"""
+    return {
+        'TELEGRAM_TOKEN': user.telegram_token,
+        'CHAT_ID': user.telegram_chat_id,
+        'WALLET_ADDRESS': user.wallet_address,
+        'API_WALLET_ADDRESS': user.api_wallet_address,
+        'API_PUBLIC_KEY': user.api_public_key,
+        'API_PRIVATE_KEY': user.api_private_key,
+        'CHECK_INTERVAL': user.check_interval or DEFAULT_CHECK_INTERVAL,
+        'DAILY_REPORT_TIME': user.daily_report_time or DEFAULT_DAILY_REPORT_TIME,
+    }
+
+
+def _apply_config(user_id: int, config: Dict, new_config: Dict, listeners: List[ConfigListener]) -> Dict:
+    """Met à jour config en place et prévient les listeners ; retourne {clé: ancienne valeur}"""
+    changed = {key: config.get(key) for key, value in new_config.items() if config.get(key) != value}
+    if not changed:
+        return changed
+    config.update(new_config)
+    logger.info(f"Config utilisateur {user_id} mise à jour: {', '.join(changed)}")
+    for listener in listeners:
+        try:
+            listener(user_id, config, changed)
+        except Exception as e:
+            logger.error(f"Erreur listener config utilisateur {user_id}: {e}")
+    return changed
+
+
+def send_config(stream: TextIO, config: Dict):
+    """Envoie une version complète de la config à un bot (stdin)"""
+    stream.write(json.dumps(config) + "\n")
+    stream.flush()
+
+
+def record_config_change(db: Session, user_id: int):
+    """Signale aux registres qu'une config a changé (sans commit)"""
+    db.add(TenantConfigChange(user_id=user_id))
+    db.flush()
+    # Purge du journal ; la ligne ajoutée garde le seq max (pas de réutilisation du seq par SQLite)
+    db.query(TenantConfigChange).filter(
+        TenantConfigChange.changed_at < datetime.utcnow() - JOURNAL_RETENTION
+    ).delete(synchronize_session=False)
+
+
+class TenantConfigRegistry:
+    def __init__(self, user_ids: Optional[Iterable[int]] = None, poll_interval: float = POLL_INTERVAL):
+        self.user_ids = set(user_ids) if user_ids is not None else None
+        self.poll_interval = poll_interval
+        self.configs: Dict[int, Dict] = {}
+        self.last_seq = 0
+        self.listeners: List[ConfigListener] = []
+        self.pending = set()        # Nouveaux utilisateurs à relire (changement antérieur à leur ajout)
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _users(self, db: Session, user_ids: Optional[Iterable[int]]) -> List[User]:
+        query = db.query(User)
+        if user_ids is not None:
+            query = query.filter(User.id.in_(list(user_ids)))
+        return query.all()
+
+    def load(self):
+        """Chargement initial en une requête"""
+        db = SessionLocal()
+        try:
+            # Curseur lu avant les configs : aucun changement concurrent n'est perdu
+            self.last_seq = db.query(func.max(TenantConfigChange.seq)).scalar() or 0
+            for user in self._users(db, self.user_ids):
+                self.configs[user.id] = tenant_config(user)
+        finally:
+            db.close()
+        logger.info(f"Registre de config chargé ({len(self.configs)} utilisateurs)")
+
+    def set_users(self, users: Iterable[User]):
+        """Suit exactement ces utilisateurs (lignes déjà chargées par le worker : pas de requête)"""
+        users = list(users)
+        with self.lock:
+            self.user_ids = {user.id for user in users}
+            for user in users:
+                if user.id not in self.configs:
+                    self.configs[user.id] = tenant_config(user)
+                    self.pending.add(user.id)
+            for user_id in set(self.configs) - self.user_ids:
+                del self.configs[user_id]
+            self.pending &= self.user_ids
+
+    def get(self, user_id: int) -> Dict:
+        """Dictionnaire de config vivant (mis à jour en place)"""
+        return self.configs[user_id]
+
+    def on_change(self, listener: ConfigListener):
+        """listener(user_id, config, changed) avec changed = {clé: ancienne valeur}"""
+        self.listeners.append(listener)
+
+    def refresh(self) -> Dict[int, Dict]:
+        """Applique les changements publiés depuis le dernier appel"""
+        with self.lock:
+            return self._refresh()
+
+    def _refresh(self) -> Dict[int, Dict]:
+        db = SessionLocal()
+        try:
+            query = db.query(TenantConfigChange.seq, TenantConfigChange.user_id).filter(
+                TenantConfigChange.seq > self.last_seq
+            )
+            if self.user_ids is not None:
+                query = query.filter(TenantConfigChange.user_id.in_(list(self.user_ids)))
+            changes = query.all()
+            user_ids = {change.user_id for change in changes} | self.pending
+            if not user_ids:
+                return {}
+
+            if changes:
+                self.last_seq = max(change.seq for change in changes)
+            self.pending = set()
+            users = self._users(db, user_ids)
+        finally:
+            db.close()
+
+        applied = {}
+        for user in users:
+            changed = _apply_config(user.id, self.configs.setdefault(user.id, {}), tenant_config(user), self.listeners)
+            if changed:
+                applied[user.id] = changed
+        return applied
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Erreur rafraîchissement config: {e}")
+
+    def start(self):
+        """Suit les changements en arrière-plan"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="tenant-config", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class ConfigStream:
+    """Côté bot : config reçue du worker sur stdin, mise à jour en place"""
+
+    def __init__(self, user_id: int, stream: Optional[TextIO] = None):
+        self.user_id = user_id
+        self.stream = stream or sys.stdin
+        line = self.stream.readline()
+        if not line:
+            raise RuntimeError("Aucune configuration reçue du worker sur stdin")
+        self.config: Dict = json.loads(line)
+        self.listeners: List[ConfigListener] = []
+        self._thread = None
+
+    def on_change(self, listener: ConfigListener):
+        """listener(user_id, config, changed) avec changed = {clé: ancienne valeur}"""
+        self.listeners.append(listener)
+
+    def _run(self, on_close: Optional[Callable[[], None]]):
+        for line in self.stream:
+            try:
+                new_config = json.loads(line)
+            except ValueError:
+                logger.error("Config illisible reçue du worker")
+                continue
+            _apply_config(self.user_id, self.config, new_config, self.listeners)
+        # Fin de stdin : le worker s'est arrêté ou a été tué
+        logger.info("Canal de config fermé par le worker")
+        if on_close:
+            on_close()
+
+    def start(self, on_close: Optional[Callable[[], None]] = None):
+        """Suit les mises à jour en arrière-plan ; on_close est appelé à la fin de stdin"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(on_close,), name="tenant-config", daemon=True)
+            self._thread.start()
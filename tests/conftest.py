@@ -0,0 +1,18 @@
+import os
+import tempfile
+
+# Base SQLite isolée, fixée avant le premier import de database
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+
+import pytest
+
+from database import Base, engine, SessionLocal
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
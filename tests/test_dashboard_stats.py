@@ -0,0 +1,32 @@
+from database import SessionLocal, User
+from dashboard_stats import increment, set_user_flag, get_stats
+
+
+def test_concurrent_activations_counted_once(db):
+    db.add(User(id=1, email="u1@example.com", is_active=False))
+    db.commit()
+
+    # Deux requêtes ont lu l'utilisateur inactif avant que l'une ne l'active
+    first, second = SessionLocal(), SessionLocal()
+    try:
+        assert not first.get(User, 1).is_active and not second.get(User, 1).is_active
+        for session in (first, second):
+            if set_user_flag(session, 1, User.is_active, True):
+                increment(session, "active_users")
+            session.commit()
+    finally:
+        first.close()
+        second.close()
+
+    assert get_stats(db)['active_users'] == 1
+
+
+def test_flag_toggles_and_null_counts_as_unset(db):
+    db.add(User(id=1, email="u1@example.com", signum_connected=None, is_active=True))
+    db.commit()
+
+    assert set_user_flag(db, 1, User.signum_connected, True)
+    assert not set_user_flag(db, 1, User.signum_connected, True)
+    assert set_user_flag(db, 1, User.is_active, False)
+    assert not set_user_flag(db, 1, User.is_active, False)
+    assert not set_user_flag(db, 2, User.is_active, True)
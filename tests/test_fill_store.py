@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from fill_store import FillStore, FILL_DTYPE
+
+WALLET = "0x" + "ab" * 20
+
+
+def _fill(time, tid, coin="BTC", side="B", px=100.0, sz=1.0, pnl=0.0):
+    return {'time': time, 'tid': tid, 'oid': tid, 'coin': coin, 'side': side,
+            'px': str(px), 'sz': str(sz), 'fee': "0.1", 'closedPnl': str(pnl)}
+
+
+def test_append_dedupes_overlapping_polls(tmp_path):
+    store = FillStore(WALLET, data_dir=str(tmp_path))
+    assert store.append([_fill(1000, 1), _fill(2000, 2), _fill(2000, 3)]) == 3
+    # Le poll suivant renvoie les mêmes fills + un nouveau au même timestamp
+    assert store.append([_fill(2000, 3), _fill(2000, 2), _fill(1000, 1), _fill(2000, 4)]) == 1
+    assert store.append([_fill(2000, 4)]) == 0
+    assert store.fills()['tid'].tolist() == [1, 2, 3, 4]
+
+
+def test_coin_ids_persisted(tmp_path):
+    store = FillStore(WALLET, data_dir=str(tmp_path))
+    store.append([_fill(1000, 1, coin="BTC"), _fill(2000, 2, coin="ETH"), _fill(3000, 3, coin="BTC")])
+
+    reopened = FillStore(WALLET.upper().replace("0X", "0x"), data_dir=str(tmp_path))
+    assert reopened.coins == ["BTC", "ETH"]
+    assert reopened.fills()['coin'].tolist() == [0, 1, 0]
+    assert reopened.volume_by_coin() == {"BTC": 200.0, "ETH": 100.0}
+
+
+@pytest.mark.parametrize("wallet", ["../../etc/passwd", "0x1234", "0x" + "zz" * 20, ""])
+def test_invalid_wallet_rejected(tmp_path, wallet):
+    with pytest.raises(ValueError):
+        FillStore(wallet, data_dir=str(tmp_path))
+
+
+def test_reader_does_not_truncate_partial_record(tmp_path):
+    FillStore(WALLET, data_dir=str(tmp_path)).append([_fill(1000, 1)])
+    path = os.path.join(str(tmp_path), WALLET + ".fills")
+    with open(path, 'ab') as f:
+        f.write(b"\0" * 10)  # Crash pendant une écriture
+
+    reader = FillStore(WALLET, data_dir=str(tmp_path))
+    assert len(reader.fills()) == 1
+    assert os.path.getsize(path) == FILL_DTYPE.itemsize + 10
+
+    # Le bot redémarré (seul écrivain) répare le fichier avant d'ajouter
+    FillStore(WALLET, data_dir=str(tmp_path)).append([_fill(2000, 2)])
+    assert os.path.getsize(path) == 2 * FILL_DTYPE.itemsize
+    assert reader.fills()['tid'].tolist() == [1, 2]
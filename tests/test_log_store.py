@@ -0,0 +1,63 @@
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import log_store
+from log_store import SegmentHandler, query_logs
+
+
+def _record(level, message, created):
+    record = logging.LogRecord("bot", level, __file__, 0, message, None, None)
+    record.created = created
+    return record
+
+
+def test_query_active_segment_by_level(tmp_path):
+    handler = SegmentHandler(1, log_dir=str(tmp_path))
+    now = time.time()
+    handler.emit(_record(logging.INFO, "démarrage", now - 2))       # Index écrit avec max_level=INFO
+    handler.emit(_record(logging.ERROR, "échec API", now - 1))  # Pas encore dans l'index
+
+    entries = query_logs(user_id=1, min_level=logging.ERROR, log_dir=str(tmp_path))
+    assert [e['message'] for e in entries] == ["échec API"]
+    handler.close()
+
+
+def test_orphan_segment_sealed_at_startup(tmp_path):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    now = time.time()
+    name = f"bot_1_{int(now * 1000)}_{socket.gethostname()}_{dead.pid}_1.jsonl"
+    with open(tmp_path / name, 'w', encoding='utf-8') as f:
+        for ts, level in ((now - 10, "INFO"), (now - 5, "ERROR")):
+            f.write(json.dumps({'ts': ts, 'level': level, 'user_id': 1,
+                                'logger': 'bot', 'message': level}) + "\n")
+
+    handler = SegmentHandler(1, log_dir=str(tmp_path))
+    handler.close()
+
+    assert not os.path.exists(tmp_path / name)
+    assert os.path.exists(tmp_path / (name + ".gz"))
+    entries = query_logs(user_id=1, min_level=logging.ERROR, log_dir=str(tmp_path))
+    assert [e['message'] for e in entries] == ["ERROR"]
+
+
+def test_query_stops_at_older_segments(tmp_path, monkeypatch):
+    handler = SegmentHandler(1, log_dir=str(tmp_path), max_bytes=1000)
+    now = time.time()
+    for i in range(100):
+        handler.emit(_record(logging.INFO, f"ligne {i}", now - 100 + i))
+    handler.close()
+
+    opened = []
+    read_segment = log_store._read_segment
+    monkeypatch.setattr(log_store, "_read_segment", lambda path: opened.append(path) or read_segment(path))
+
+    entries = query_logs(user_id=1, limit=5, log_dir=str(tmp_path))
+    assert [e['message'] for e in entries] == [f"ligne {i}" for i in range(99, 94, -1)]
+    assert 1 <= len(opened) <= 2
+    assert len(os.listdir(tmp_path)) > 5
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import NotificationOutbox
+from outbox import enqueue, enqueue_many, deliver_pending, purge_outbox, MAX_ATTEMPTS
+
+
+def _notification(key, user_id=1):
+    return {'user_id': user_id, 'idempotency_key': key, 'message': key}
+
+
+def test_enqueue_is_idempotent(db):
+    enqueue_many([_notification("fill:1:a"), _notification("fill:1:b")])
+    enqueue_many([_notification("fill:1:b"), _notification("fill:1:c")])
+    enqueue(1, "fill:1:a", "doublon")
+
+    keys = [n.idempotency_key for n in db.query(NotificationOutbox).order_by(NotificationOutbox.id)]
+    assert keys == ["fill:1:a", "fill:1:b", "fill:1:c"]
+
+
+def test_each_delivery_committed_before_the_next(db):
+    enqueue_many([_notification("a"), _notification("b")])
+
+    def send(notification):
+        if notification.idempotency_key == "b":
+            raise RuntimeError("crash")
+        return True
+
+    with pytest.raises(RuntimeError):
+        deliver_pending(send)
+    status = {n.idempotency_key: n.status for n in db.query(NotificationOutbox)}
+    assert status == {"a": "sent", "b": "pending"}
+
+
+def test_failed_delivery_backs_off_then_gives_up(db):
+    enqueue(1, "a", "message")
+    assert deliver_pending(lambda n: False) == 0
+    notification = db.query(NotificationOutbox).one()
+    assert notification.attempts == 1
+    assert notification.next_attempt_at > datetime.utcnow()
+
+    assert deliver_pending(lambda n: True) == 0        # Pas encore réessayable
+    for _ in range(MAX_ATTEMPTS):
+        db.query(NotificationOutbox).update({NotificationOutbox.next_attempt_at: datetime.utcnow()})
+        db.commit()
+        deliver_pending(lambda n: False)
+    db.expire_all()
+    assert db.query(NotificationOutbox).one().status == 'failed'
+
+
+def test_purge_keeps_pending_and_recent(db):
+    enqueue_many([_notification("old-sent"), _notification("old-pending"), _notification("new-sent")])
+    deliver_pending(lambda n: n.idempotency_key != "old-pending")
+    db.query(NotificationOutbox).filter(NotificationOutbox.idempotency_key.like("old-%")).update(
+        {NotificationOutbox.created_at: datetime.utcnow() - timedelta(days=30)}, synchronize_session=False
+    )
+    db.commit()
+
+    assert purge_outbox(db) == 1
+    db.commit()
+    assert {n.idempotency_key for n in db.query(NotificationOutbox)} == {"old-pending", "new-sent"}
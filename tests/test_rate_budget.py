@@ -0,0 +1,98 @@
+import multiprocessing
+import time
+
+import pytest
+
+import database
+import rate_budget
+from rate_budget import (RateBudget, BudgetUnavailable, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND,
+                         CIRCUIT_BASE_DELAY)
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _granted(budget, priority, weight=10, attempts=20):
+    return sum(weight for _ in range(attempts) if budget._try_reserve(weight, priority) == 0)
+
+
+def test_background_share_keeps_interactive_reserve(db):
+    budget = RateBudget(limit=100)
+    assert _granted(budget, PRIORITY_BACKGROUND) == 80
+    assert _granted(budget, PRIORITY_INTERACTIVE) == 20
+    assert _granted(budget, PRIORITY_INTERACTIVE) == 0
+
+    status = budget.status()
+    assert (status['used'], status['remaining'], status['remaining_background']) == (100, 0, 0)
+
+
+def test_instances_share_the_budget(db):
+    first, second = RateBudget(limit=100), RateBudget(limit=100)
+    granted = 0
+    for _ in range(10):
+        granted += _granted(first, PRIORITY_INTERACTIVE, attempts=1)
+        granted += _granted(second, PRIORITY_INTERACTIVE, attempts=1)
+    assert granted == 100
+
+
+def _reserve_in_child(queue):
+    database.engine.dispose(close=False)     # Connexions héritées du parent non réutilisées
+    queue.put(_granted(RateBudget(limit=100), PRIORITY_INTERACTIVE, attempts=10))
+
+
+def test_processes_never_exceed_the_budget(db):
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    children = [context.Process(target=_reserve_in_child, args=(queue,)) for _ in range(4)]
+    for child in children:
+        child.start()
+    granted = sum(queue.get(timeout=30) for _ in children)
+    for child in children:
+        child.join()
+    # Réserver puis vérifier : jamais plus que la limite, même en concurrence
+    assert granted <= 100
+    assert RateBudget(limit=100).status()['used'] == granted
+
+
+@pytest.mark.parametrize("status_code", [429, 502])
+def test_circuit_opens_with_exponential_backoff(db, status_code):
+    budget = RateBudget()
+    with pytest.raises(HTTPError):
+        budget.call(lambda: (_ for _ in ()).throw(HTTPError(status_code)), weight=2)
+    first = budget.status()
+    assert first['circuit_open'] and first['consecutive_failures'] == 1
+    assert first['circuit_open_until'] == pytest.approx(time.time() + CIRCUIT_BASE_DELAY, abs=1)
+
+    budget.record_failure(status_code)
+    assert budget.status()['circuit_open_until'] == pytest.approx(time.time() + 2 * CIRCUIT_BASE_DELAY, abs=1)
+
+    # Disjoncteur ouvert : plus aucune requête ne part
+    calls = []
+    with pytest.raises(BudgetUnavailable):
+        budget.call(lambda: calls.append(1), weight=2, timeout=0.1)
+    assert not calls
+
+
+def test_client_errors_do_not_open_circuit(db):
+    budget = RateBudget()
+    with pytest.raises(HTTPError):
+        budget.call(lambda: (_ for _ in ()).throw(HTTPError(400)), weight=2)
+    assert not budget.status()['circuit_open']
+
+
+def test_success_resets_failures(db, monkeypatch):
+    budget = RateBudget()
+    budget.record_failure(429)
+    database_circuit = db.query(database.RateBudgetCircuit).one()
+    database_circuit.open_until = 0.0
+    db.commit()
+
+    assert budget.call(lambda: "ok", weight=2) == "ok"
+    assert budget.status()['consecutive_failures'] == 0
+
+    # Sans échec en cours, un succès n'ouvre pas de session
+    monkeypatch.setattr(rate_budget, "SessionLocal", lambda: pytest.fail("requête inutile"))
+    budget.record_success()
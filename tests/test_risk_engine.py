@@ -0,0 +1,130 @@
+import threading
+
+import numpy as np
+import pytest
+
+import risk_engine
+from database import NotificationOutbox
+from fill_store import FillStore
+from risk_engine import RiskEngine, RiskMonitor
+
+WALLET = "0x" + "cd" * 20
+
+
+def _snapshot(szi=1.0, px=100.0, liquidation_px=92.0, account_value=1000.0, maintenance=10.0):
+    return {
+        'assetPositions': [{'position': {
+            'coin': 'BTC', 'szi': str(szi), 'positionValue': str(abs(szi) * px),
+            'entryPx': str(px), 'liquidationPx': str(liquidation_px),
+        }}],
+        'marginSummary': {'accountValue': str(account_value)},
+        'crossMaintenanceMarginUsed': str(maintenance),
+    }
+
+
+def test_liquidation_hysteresis_ignores_missing_prices():
+    engine = RiskEngine()
+    engine.apply_snapshot(1, _snapshot())
+
+    alerts, _ = engine.evaluate({'BTC': 100.0})           # 8 % de la liquidation
+    assert [a['kind'] for a in alerts] == ['liquidation']
+    assert engine.evaluate({}) == ([], [])                # Prix absent : pas de réarmement
+    assert engine.evaluate({'BTC': 101.0}) == ([], [])    # Toujours sous le seuil de réarmement
+
+    alerts, rearms = engine.evaluate({'BTC': 120.0})
+    assert alerts == [] and rearms == [{'kind': 'liquidation', 'user_id': 1, 'coin': 'BTC'}]
+    alerts, _ = engine.evaluate({'BTC': 100.0})
+    assert len(alerts) == 1
+
+
+def test_margin_not_rearmed_without_prices():
+    engine = RiskEngine()
+    engine.apply_snapshot(1, _snapshot(liquidation_px=10.0, account_value=100.0, maintenance=90.0))
+
+    alerts, _ = engine.evaluate({'BTC': 100.0})
+    assert [a['kind'] for a in alerts] == ['margin']
+    assert engine.evaluate({}) == ([], [])
+    assert engine.evaluate({'BTC': 100.0}) == ([], [])
+
+
+def test_restored_alert_not_resent():
+    engine = RiskEngine()
+    engine.apply_snapshot(1, _snapshot())
+    engine.restore_alert(1, 'liquidation', 'BTC')
+    assert engine.evaluate({'BTC': 100.0}) == ([], [])
+
+
+def test_fills_with_new_coin_from_another_store(tmp_path):
+    writer = FillStore(WALLET, data_dir=str(tmp_path))
+    reader = FillStore(WALLET, data_dir=str(tmp_path))
+    writer.append([{'time': 1000, 'tid': 1, 'oid': 1, 'coin': 'BTC', 'side': 'B',
+                    'px': '100', 'sz': '1', 'fee': '0', 'closedPnl': '0'}])
+    assert reader.coins == [] and len(reader.fills()) == 1
+
+    engine = RiskEngine()
+    engine.apply_snapshot(1, _snapshot(liquidation_px=50.0))
+    writer.append([{'time': 2000, 'tid': 2, 'oid': 2, 'coin': 'ETH', 'side': 'A',
+                    'px': '10', 'sz': '3', 'fee': '0', 'closedPnl': '0'}])
+
+    fills = reader.range(1001, None)
+    engine.apply_fills(1, fills, reader.coins)
+    row = engine.rows[(engine.users[1], engine.coins['ETH'])]
+    assert np.isclose(engine.szi[row], -3.0)
+
+
+class FakeInfo:
+    def __init__(self, mid=100.0):
+        self.mid = mid
+        self.release = threading.Event()
+        self.release.set()
+        self.waiting = threading.Event()
+
+    def user_state(self, wallet):
+        return _snapshot()
+
+    def all_mids(self):
+        self.waiting.set()
+        self.release.wait(timeout=5)
+        return {'BTC': self.mid}
+
+
+def test_set_users_not_blocked_by_tick_io(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(risk_engine, "FillStore", lambda wallet: FillStore(wallet, data_dir=str(tmp_path)))
+    info = FakeInfo()
+    monitor = RiskMonitor(info=info)
+    monitor.set_users({1: WALLET})
+    info.release.clear()
+    tick = threading.Thread(target=monitor.tick)
+    tick.start()
+    assert info.waiting.wait(timeout=5)
+
+    # all_mids en cours : le rééquilibrage du worker ne doit pas attendre
+    done = threading.Event()
+    threading.Thread(target=lambda: (monitor.set_users({1: WALLET, 2: WALLET}), done.set())).start()
+    assert done.wait(timeout=1)
+    info.release.set()
+    tick.join(timeout=5)
+
+    assert set(monitor.wallets) == {1}
+    monitor.tick()
+    assert set(monitor.wallets) == {1, 2}
+
+
+def test_alert_kept_armed_when_outbox_fails(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(risk_engine, "FillStore", lambda wallet: FillStore(wallet, data_dir=str(tmp_path)))
+    monitor = RiskMonitor(info=FakeInfo())
+    monitor.set_users({1: WALLET})
+
+    def failing_enqueue(notifications):
+        raise RuntimeError("base verrouillée")
+
+    monkeypatch.setattr(risk_engine, "enqueue_many", failing_enqueue)
+    with pytest.raises(RuntimeError):
+        monitor.tick()
+    assert monitor.alert_state[1] == {}
+
+    monkeypatch.undo()
+    monitor.tick()
+    keys = [n.idempotency_key for n in db.query(NotificationOutbox)]
+    assert keys == ["risk:liquidation:1:BTC:1"]
+    assert monitor.alert_state[1][('liquidation', 'BTC')] == [1, True]
@@ -0,0 +1,47 @@
+from collections import Counter
+
+from database import Worker, BotAssignment
+from sharding import HashRing, claim_assignment, still_assigned
+
+USERS = range(1, 3001)
+
+
+def test_ring_is_balanced():
+    ring = HashRing(["w1", "w2", "w3"])
+    counts = Counter(ring.get(user_id) for user_id in USERS)
+    assert set(counts) == {"w1", "w2", "w3"}
+    assert max(counts.values()) < 1.3 * len(USERS) / 3
+    assert min(counts.values()) > 0.7 * len(USERS) / 3
+
+
+def test_new_worker_only_takes_its_share():
+    before = HashRing(["w1", "w2", "w3"])
+    after = HashRing(["w1", "w2", "w3", "w4"])
+    moved = [user_id for user_id in USERS if before.get(user_id) != after.get(user_id)]
+    assert all(after.get(user_id) == "w4" for user_id in moved)
+    assert 0.15 < len(moved) / len(USERS) < 0.35
+
+
+def test_empty_ring():
+    assert HashRing([]).get(1) is None
+
+
+def test_claim_waits_for_live_owner(db):
+    db.add(BotAssignment(user_id=1, worker_id="w1", hostname="h1", bot_pid=100))
+    db.commit()
+
+    assert not claim_assignment(db, 1, "w2", "h2", workers=["w1", "w2"])
+    assert still_assigned(1, "w1", "h1", 100)
+
+    # w1 ne donne plus de heartbeat : reprise possible, le bot de w1 doit s'arrêter
+    assert claim_assignment(db, 1, "w2", "h2", workers=["w2"])
+    assert not still_assigned(1, "w1", "h1", 100)
+    # PID de l'ancien bot gardé pendant le délai de garde : aucun autre worker ne peut reprendre
+    assert not claim_assignment(db, 1, "w3", "h3", workers=["w2", "w3"])
+
+
+def test_claim_free_assignment(db):
+    assert claim_assignment(db, 2, "w1", "h1", workers=["w1"])          # Ligne absente
+    db.query(BotAssignment).filter(BotAssignment.user_id == 2).update({BotAssignment.bot_pid: None})
+    db.commit()
+    assert claim_assignment(db, 2, "w2", "h2", workers=["w1", "w2"])    # Aucun bot lancé
@@ -0,0 +1,92 @@
+import io
+import json
+import subprocess
+import threading
+from datetime import datetime, timedelta
+
+from database import User, TenantConfigChange
+from tenant_config import TenantConfigRegistry, ConfigStream, record_config_change, send_config
+from worker import BotWorker
+
+
+def _add_users(db, count):
+    users = [User(id=i, email=f"u{i}@example.com", telegram_chat_id="1", check_interval=30)
+             for i in range(1, count + 1)]
+    db.add_all(users)
+    db.commit()
+    return users
+
+
+def _change(db, user_id, **values):
+    db.query(User).filter(User.id == user_id).update(values)
+    record_config_change(db, user_id)
+    db.commit()
+
+
+def test_bulk_load_and_refresh(db):
+    _add_users(db, 3)
+    registry = TenantConfigRegistry()
+    registry.load()
+    assert set(registry.configs) == {1, 2, 3}
+
+    seen = []
+    registry.on_change(lambda user_id, config, changed: seen.append((user_id, changed)))
+    _change(db, 2, check_interval=10)
+    assert registry.refresh() == {2: {'CHECK_INTERVAL': 30}}
+    assert registry.get(2)['CHECK_INTERVAL'] == 10
+    assert seen == [(2, {'CHECK_INTERVAL': 30})]
+    assert registry.refresh() == {}
+
+
+def test_shard_registry_ignores_other_users_and_rereads_new_ones(db):
+    users = _add_users(db, 3)
+    registry = TenantConfigRegistry(user_ids=set())
+    registry.load()
+    registry.set_users(users[:1])
+
+    _change(db, 2, check_interval=10)     # Hors de la part du worker
+    assert registry.refresh() == {}
+
+    # Utilisateur ajouté avec une ligne lue avant le changement : relu au refresh suivant
+    stale = User(id=3, email="u3@example.com", telegram_chat_id="1", check_interval=30)
+    _change(db, 3, telegram_chat_id="2")
+    registry.set_users([users[0], stale])
+    assert registry.refresh() == {3: {'CHAT_ID': "1"}}
+    assert set(registry.configs) == {1, 3}
+
+
+def test_journal_pruned(db):
+    _add_users(db, 1)
+    db.add_all([TenantConfigChange(user_id=1, changed_at=datetime.utcnow() - timedelta(days=2)) for _ in range(3)])
+    db.commit()
+    record_config_change(db, 1)
+    db.commit()
+    assert [change.seq for change in db.query(TenantConfigChange)] == [4]
+
+
+def test_config_stream_applies_updates_and_reports_eof():
+    stream = io.StringIO(json.dumps({'CHECK_INTERVAL': 30, 'CHAT_ID': "1"}) + "\n"
+                         + json.dumps({'CHECK_INTERVAL': 5, 'CHAT_ID': "1"}) + "\n")
+    config_stream = ConfigStream(1, stream)
+    config = config_stream.config
+    assert config['CHECK_INTERVAL'] == 30
+
+    changes = []
+    closed = threading.Event()
+    config_stream.on_change(lambda user_id, config, changed: changes.append(changed))
+    config_stream.start(on_close=closed.set)
+    assert closed.wait(timeout=5)
+    assert changes == [{'CHECK_INTERVAL': 30}]
+    assert config is config_stream.config and config['CHECK_INTERVAL'] == 5
+
+
+def test_worker_pushes_config_to_bot_stdin():
+    process = subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    worker = BotWorker("w1")
+    worker.bots[1] = process
+    send_config(process.stdin, {'CHECK_INTERVAL': 30})
+    worker.push_config(1, {'CHECK_INTERVAL': 5}, {'CHECK_INTERVAL': 30})
+    process.stdin.close()       # EOF : cat se termine après avoir recopié les lignes
+    lines = process.stdout.read().splitlines()
+    process.wait(timeout=5)
+    assert [json.loads(line)['CHECK_INTERVAL'] for line in lines] == [30, 5]
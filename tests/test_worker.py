@@ -0,0 +1,102 @@
+import signal
+import socket
+import subprocess
+from collections import Counter
+
+import pytest
+
+import worker
+from database import User, BotAssignment
+from worker import BotWorker
+
+
+@pytest.fixture
+def processes(monkeypatch):
+    """Bots remplacés par des `sleep` dans leur propre session"""
+    started = []
+
+    def create_user_bot(user, worker_id, config):
+        process = subprocess.Popen(["sleep", "60"], start_new_session=True)
+        started.append((user.id, process))
+        return process
+
+    monkeypatch.setattr(worker, "create_user_bot", create_user_bot)
+    yield started
+    for _, process in started:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def _tick(db, *workers):
+    for w in workers:
+        w.heartbeat(db)
+        db.commit()
+    for w in workers:
+        w.reconcile(db)
+        db.commit()
+
+
+def _running(processes):
+    return Counter(user_id for user_id, process in processes if process.poll() is None)
+
+
+def _add_users(db, count):
+    for i in range(1, count + 1):
+        db.add(User(id=i, email=f"u{i}@example.com", is_active=True))
+    db.commit()
+
+
+def test_workers_split_users(db, processes):
+    _add_users(db, 30)
+    w1, w2 = BotWorker("w1"), BotWorker("w2")
+    _tick(db, w1, w2)
+    _tick(db, w1, w2)   # Chacun voit l'autre à partir du second tour
+
+    assert set(w1.bots).isdisjoint(w2.bots)
+    assert set(w1.bots) | set(w2.bots) == set(range(1, 31))
+    assert max(_running(processes).values()) == 1
+    owners = {a.user_id: a.worker_id for a in db.query(BotAssignment)}
+    assert all(owners[user_id] == "w1" for user_id in w1.bots)
+
+
+def test_new_worker_waits_for_release(db, processes):
+    _add_users(db, 30)
+    w1, w2 = BotWorker("w1"), BotWorker("w2")
+    w1.heartbeat(db)
+    db.commit()
+    _tick(db, w1)
+    assert len(w1.bots) == 30
+
+    # w2 arrive et réconcilie avant que w1 ait vu le changement d'anneau
+    w2.heartbeat(db)
+    db.commit()
+    w2.reconcile(db)
+    assert not w2.bots
+    assert max(_running(processes).values()) == 1
+
+    w1.reconcile(db)        # Arrête et libère la part de w2
+    assert max(_running(processes).values()) == 1
+    w2.reconcile(db)
+    assert w2.bots and set(w1.bots).isdisjoint(w2.bots)
+    assert set(w1.bots) | set(w2.bots) == set(range(1, 31))
+    assert max(_running(processes).values()) == 1
+
+
+def test_orphan_of_dead_worker_killed_before_takeover(db, processes):
+    _add_users(db, 1)
+    orphan = subprocess.Popen(["sleep", "60"], start_new_session=True)
+    processes.append((1, orphan))
+    db.add(BotAssignment(user_id=1, worker_id="dead", hostname=socket.gethostname(), bot_pid=orphan.pid))
+    db.commit()
+
+    w1 = BotWorker("w1")
+    _tick(db, w1)
+    assert orphan.wait(timeout=5) == -signal.SIGTERM
+    assert not w1.bots           # Délai de garde avant la relance
+
+    w1.start_after[1] = 0
+    _tick(db, w1)
+    assert 1 in w1.bots
+    assignment = db.query(BotAssignment).one()
+    assert (assignment.worker_id, assignment.bot_pid) == ("w1", w1.bots[1].pid)
@@ -0,0 +1,245 @@
+# worker.py - Worker d'exécution des bots (séparé de l'API FastAPI)
+"""
+Chaque worker s'enregistre dans la table workers (heartbeat), calcule sa
+part des utilisateurs actifs par hachage cohérent et lance/arrête les bots
+correspondants. Quand un worker arrive ou disparaît, l'anneau change et les
+autres workers rééquilibrent au tour suivant. Le worker surveille aussi le
+risque de liquidation de ses utilisateurs (risk_engine).
+
+Plusieurs workers sur une même machine :
+    python worker.py --worker-id w1 &
+    python worker.py --worker-id w2 &
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+
+from database import Base, engine, SessionLocal, User, Worker, BotAssignment
+from bot_runner import create_user_bot
+from sharding import (HashRing, HEARTBEAT_TTL, FENCE_INTERVAL, live_workers,
+                      claim_assignment, release_assignments)
+from risk_engine import RiskMonitor
+from fill_store import is_valid_wallet
+from outbox import purge_outbox
+from tenant_config import TenantConfigRegistry, send_config
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("worker")
+
+# Configuration
+RECONCILE_INTERVAL = 3      # Secondes entre deux heartbeats / rééquilibrages
+PURGE_INTERVAL = 3600       # Secondes entre deux purges de l'outbox
+STALE_WORKER_AFTER = 10 * HEARTBEAT_TTL
+TAKEOVER_GRACE = FENCE_INTERVAL + RECONCILE_INTERVAL   # Délai avant de relancer un bot repris
+
+
+class BotWorker:
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self.hostname = socket.gethostname()
+        self.bots: Dict[int, subprocess.Popen] = {}
+        self.start_after: Dict[int, float] = {}     # Reprises en attente du délai de garde
+        self.running = True
+        self.risk_monitor = None
+        self.last_purge = 0.0
+        # Config de la part du worker : un seul poll du journal, changements poussés aux bots
+        self.registry = TenantConfigRegistry(user_ids=set())
+        self.registry.on_change(self.push_config)
+
+    def heartbeat(self, db):
+        worker = db.query(Worker).filter(Worker.worker_id == self.worker_id).first()
+        if not worker:
+            worker = Worker(worker_id=self.worker_id, hostname=self.hostname, pid=os.getpid())
+            db.add(worker)
+            logger.info(f"Worker {self.worker_id} enregistré")
+        worker.heartbeat_at = datetime.utcnow()
+
+        # Nettoyage des workers disparus depuis longtemps
+        cutoff = datetime.utcnow() - timedelta(seconds=STALE_WORKER_AFTER)
+        db.query(Worker).filter(Worker.heartbeat_at < cutoff).delete()
+
+    def reconcile(self, db):
+        """Aligne les bots locaux sur la part de l'anneau de ce worker"""
+        workers = live_workers(db)
+        ring = HashRing(workers)
+        active_users = db.query(User).filter(User.is_active == True).all()
+        owned = {user.id: user for user in active_users if ring.get(user.id) == self.worker_id}
+
+        # Arrêter les bots qui ne nous appartiennent plus, puis libérer leur affectation
+        released = [user_id for user_id in self.bots if user_id not in owned]
+        for user_id in released:
+            self.stop_bot(user_id)
+        if released:
+            release_assignments(db, released, self.worker_id)
+            db.commit()
+        for user_id in set(self.start_after) - set(owned):
+            del self.start_after[user_id]
+        self.registry.set_users(owned.values())
+
+        if self.risk_monitor:
+            self.risk_monitor.set_users({
+                user_id: user.wallet_address for user_id, user in owned.items() if is_valid_wallet(user.wallet_address)
+            })
+
+        assignments = {
+            row.user_id: row for row in db.query(
+                BotAssignment.user_id, BotAssignment.worker_id, BotAssignment.hostname, BotAssignment.bot_pid
+            ).filter(BotAssignment.user_id.in_(list(owned))).all()
+        } if owned else {}
+
+        for user_id, user in owned.items():
+            process = self.bots.get(user_id)
+            if process is not None and process.poll() is None:
+                continue
+            if process is not None:
+                logger.warning(f"Bot {user_id} arrêté (code {process.returncode}), relance")
+                del self.bots[user_id]
+
+            # Un seul bot par utilisateur : attendre que l'ancien propriétaire libère l'affectation
+            if not claim_assignment(db, user_id, self.worker_id, self.hostname, workers):
+                continue
+
+            previous = assignments.get(user_id)
+            if previous and previous.bot_pid and process is None and user_id not in self.start_after:
+                # Bot d'un worker mort ou bloqué : l'arrêter (même machine) et lui laisser le temps
+                # de constater la reprise (still_assigned) avant d'en lancer un nouveau
+                if previous.hostname == self.hostname:
+                    self.kill_orphan(user_id, previous.bot_pid)
+                self.start_after[user_id] = time.time() + TAKEOVER_GRACE
+            if time.time() < self.start_after.get(user_id, 0):
+                continue
+            self.start_after.pop(user_id, None)
+
+            # PID effacé avant le lancement : still_assigned accepte le nouveau bot avant son enregistrement
+            db.query(BotAssignment).filter(
+                BotAssignment.user_id == user_id,
+                BotAssignment.worker_id == self.worker_id
+            ).update({BotAssignment.bot_pid: None}, synchronize_session=False)
+            db.commit()
+            process = create_user_bot(user, self.worker_id, self.registry.get(user_id))
+            if not process:
+                continue
+            self.bots[user_id] = process
+            recorded = db.query(BotAssignment).filter(
+                BotAssignment.user_id == user_id,
+                BotAssignment.worker_id == self.worker_id
+            ).update({BotAssignment.bot_pid: process.pid, BotAssignment.updated_at: datetime.utcnow()},
+                     synchronize_session=False)
+            if not recorded:
+                logger.warning(f"Affectation {user_id} reprise par un autre worker pendant le lancement")
+                self.stop_bot(user_id)
+                continue
+            user.bot_process_id = str(process.pid)
+            db.commit()
+
+    def push_config(self, user_id: int, config, changed):
+        """Envoie la nouvelle config au bot (thread du registre)"""
+        process = self.bots.get(user_id)
+        if process is None or process.poll() is not None:
+            return
+        try:
+            send_config(process.stdin, config)
+        except (BrokenPipeError, ValueError, OSError) as e:
+            logger.warning(f"Config non transmise au bot {user_id}: {e}")
+
+    def kill_orphan(self, user_id: int, pid: int):
+        """Arrête le groupe de processus d'un bot orphelin sur cette machine"""
+        try:
+            os.killpg(pid, signal.SIGTERM)
+            logger.warning(f"Bot orphelin {user_id} (PID {pid}) arrêté")
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def stop_bot(self, user_id: int):
+        process = self.bots.pop(user_id)
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if process.stdin:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+        logger.info(f"Bot {user_id} arrêté sur {self.worker_id}")
+
+    def tick(self):
+        db = SessionLocal()
+        try:
+            self.heartbeat(db)
+            db.commit()
+            self.reconcile(db)
+            db.commit()
+            if time.time() - self.last_purge >= PURGE_INTERVAL:
+                purged = purge_outbox(db)
+                db.commit()
+                self.last_purge = time.time()
+                if purged:
+                    logger.info(f"{purged} notifications purgées de l'outbox")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Erreur worker {self.worker_id}: {e}")
+        finally:
+            db.close()
+
+    def shutdown(self):
+        """Arrête les bots locaux et se retire de l'anneau"""
+        self.registry.stop()
+        if self.risk_monitor:
+            self.risk_monitor.stop()
+        for user_id in list(self.bots):
+            self.stop_bot(user_id)
+        db = SessionLocal()
+        try:
+            db.query(Worker).filter(Worker.worker_id == self.worker_id).delete()
+            db.query(BotAssignment).filter(BotAssignment.worker_id == self.worker_id).update(
+                {BotAssignment.worker_id: None, BotAssignment.bot_pid: None}
+            )
+            db.commit()
+        finally:
+            db.close()
+        logger.info(f"Worker {self.worker_id} arrêté")
+
+    def run(self):
+        def _stop(signum, frame):
+            self.running = False
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        logger.info(f"Démarrage du worker {self.worker_id}")
+        self.registry.load()
+        self.registry.start()
+        try:
+            self.risk_monitor = RiskMonitor()
+            self.risk_monitor.start()
+        except Exception as e:
+            logger.error(f"Surveillance du risque désactivée: {e}")
+        try:
+            while self.running:
+                self.tick()
+                time.sleep(RECONCILE_INTERVAL)
+        finally:
+            self.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker d'exécution des bots HyperLiquid")
+    parser.add_argument("--worker-id", default=os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    BotWorker(args.worker_id).run()
+
+
+if __name__ == "__main__":
+    main()